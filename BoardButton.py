@@ -52,13 +52,6 @@ class BoardButton(Button):
     def is_flag(self):
         return self.is_flagged
 
-    def place_mine(self):
-        if not self.is_a_mine:
-            self._value = -1
-            self.is_a_mine = True
-            return True
-        return False
-
     def is_mine(self):
         return self.is_a_mine
 
@@ -73,12 +66,23 @@ class BoardButton(Button):
     def is_show(self):
         return self.is_visible
 
-    def reset(self):
-        self._value = 0
-        self.is_a_mine = False
-        self.is_visible = False
-        self.is_flagged = False
-        self.show_blank()
+    def sync(self, value, visible, flagged):
+        """Mirror the state of a cell in the game engine, only touching the widget when it changed."""
+        if value == self._value and visible == self.is_visible and flagged == self.is_flagged:
+            return
+        self._value = value
+        self.is_a_mine = value == -1
+        self.is_visible = visible
+        self.is_flagged = flagged
+        if visible:
+            if self.is_a_mine:
+                self.config(image=self.img_mine)
+            else:
+                self.config(image=self.img_no[value])
+        elif flagged:
+            self.config(image=self.img_flag)
+        else:
+            self.config(image=self.img_blank)
 
     def show_wrong_flag(self):
         self.config(image=self.img_wrong)
@@ -1,19 +1,45 @@
-# import time
+import time
+
+import instrument
+
+
+# domain tuple -> list indexed by bitmask, entry is the tuple of domain values in the mask
+domainTables = dict()
+
+# Domains larger than this get their curDomain tuples built on demand instead of tabled.
+MAX_TABLE_DOMAIN = 10
+
+
+def domainTable(dom):
+    """Return the shared mask -> values table for a domain, None if the domain is too large."""
+    key = tuple(dom)
+    table = domainTables.get(key)
+    if table is None and len(key) <= MAX_TABLE_DOMAIN:
+        table = [tuple(val for i, val in enumerate(key) if mask >> i & 1) for mask in range(1 << len(key))]
+        domainTables[key] = table
+    return table
 
 
 class Variable:
+    """curDomain is an int bitmask over domain indices, bit i set when dom[i] is still in it."""
+    __slots__ = ('name', 'dom', 'valueIndex', 'curDomain', 'table', 'assignedValue')
+
     def __init__(self, name, domain=None):
         if domain is None:
             domain = []
         self.name = name
         self.dom = list(domain)
-        self.curDomain = [True] * len(domain)
+        self.valueIndex = {val: i for i, val in enumerate(self.dom)}
+        self.curDomain = (1 << len(self.dom)) - 1
+        self.table = domainTable(self.dom)
         self.assignedValue = None
 
     def addDomainValues(self, values):
         for val in values:
+            self.valueIndex[val] = len(self.dom)
+            self.curDomain |= 1 << len(self.dom)
             self.dom.append(val)
-            self.curDomain.append(True)
+        self.table = domainTable(self.dom)
 
     def getDomainSize(self):
         """Return the size of the domain"""
@@ -25,44 +51,43 @@ class Variable:
 
     def pruneValue(self, value):
         """Remove value from curDomain"""
-        self.curDomain[self.getValueIndex(value)] = False
+        self.curDomain &= ~(1 << self.valueIndex[value])
 
     def depruneValue(self, value):
         """Restore value to curDomain"""
-        self.curDomain[self.getValueIndex(value)] = True
+        self.curDomain |= 1 << self.valueIndex[value]
 
     def getCurDomain(self):
-        """return list of values in curDomain"""
-        vals = []
-        if self.isAssigned():
-            vals.append(self.getAssignedValue())
+        """return the values in curDomain, a shared tuple that must not be modified"""
+        if self.assignedValue is not None:
+            mask = 1 << self.valueIndex[self.assignedValue]
         else:
-            for i, val in enumerate(self.dom):
-                if self.curDomain[i]:
-                    vals.append(val)
-        return vals
+            mask = self.curDomain
+        if self.table is not None:
+            return self.table[mask]
+        return tuple(val for i, val in enumerate(self.dom) if mask >> i & 1)
 
     def isInCurDomain(self, value):
         """check if value is in curDomain, if assigned only assigned
         value is viewed as being in curDomain"""
-        if value not in self.dom:
+        i = self.valueIndex.get(value)
+        if i is None:
             return False
-        if self.isAssigned():
-            return value == self.getAssignedValue()
+        if self.assignedValue is not None:
+            return value == self.assignedValue
         else:
-            return self.curDomain[self.getValueIndex(value)]
+            return self.curDomain >> i & 1 == 1
 
     def getCurDomainSize(self):
         """Return the size of the variables domain"""
-        if self.isAssigned():
+        if self.assignedValue is not None:
             return 1
         else:
-            return sum(1 for v in self.curDomain if v)
+            return bin(self.curDomain).count("1")
 
     def restoreCurDomain(self):
         """return all values back into curDomain"""
-        for i in range(len(self.curDomain)):
-            self.curDomain[i] = True
+        self.curDomain = (1 << len(self.dom)) - 1
 
     def isAssigned(self):
         return self.assignedValue is not None
@@ -88,7 +113,7 @@ class Variable:
 
     def getValueIndex(self, value):
         """Return the index in the domain list of a variable value"""
-        return self.dom.index(value)
+        return self.valueIndex[value]
 
     def __repr__(self):
         return "Var-{}".format(self.name)
@@ -104,6 +129,14 @@ class Constraint:
         self.sat_tuples = dict()
         self.sup_tuples = dict()
 
+        # (var, val) -> last tuple found to support it. Residues are only hints that are checked
+        # with tupleIsValid before use, so they stay correct through pruneValue/depruneValue
+        # and backtracking without ever being restored.
+        self.residues = dict()
+
+        # Bumped by the propagators each time the constraint wipes out a domain (dom/wdeg).
+        self.weight = 1
+
     def addSatisfyingTuples(self, tuples):
         """We specify the constraint by adding its complete list of satisfying tuples."""
         for x in tuples:
@@ -141,12 +174,41 @@ class Constraint:
         return vs
 
     def hasSupport(self, var, val):
-        if (var, val) in self.sup_tuples:
-            for t in self.sup_tuples[(var, val)]:
+        key = (var, val)
+        t = self.residues.get(key)
+        if t is not None and self.tupleIsValid(t):
+            return True
+        if key in self.sup_tuples:
+            for t in self.sup_tuples[key]:
                 if self.tupleIsValid(t):
+                    # A valid tuple supports every value in it, not only val.
+                    for i, v in enumerate(self.scope):
+                        self.residues[(v, t[i])] = t
                     return True
         return False
 
+    def revise(self, pruned):
+        """Prune the values in scope without a support until none is left, pruning a value can
+        take the support of another one. Pruned (var, val) pairs are appended to pruned.
+        Return (False if a variable lost its assigned value or all its values, changed variables)."""
+        changed = []
+        revised = True
+        while revised:
+            revised = False
+            for var in self.scope:
+                for val in var.getCurDomain():
+                    if self.hasSupport(var, val):
+                        continue
+                    var.pruneValue(val)
+                    pruned.append((var, val))
+                    revised = True
+                    if var not in changed:
+                        changed.append(var)
+                    # Losing the assigned value is a wipe out as well.
+                    if var.isAssigned() or not var.getCurDomainSize():
+                        return False, changed
+        return True, changed
+
     def tupleIsValid(self, t):
         """Check if every value in tuple is still in corresponding variable domains"""
         for i, var in enumerate(self.scope):
@@ -158,6 +220,81 @@ class Constraint:
         return "{}({})".format(self.name, [var.name for var in self.scope])
 
 
+class SumConstraint(Constraint):
+    """Linear constraint sum(scope) == total, with no tuple table.
+    Support comes from the min/max sums the other variables can still reach."""
+
+    def __init__(self, name, scope, total):
+        super(SumConstraint, self).__init__(name, scope)
+        self.total = total
+
+    def addSatisfyingTuples(self, tuples):
+        print("Trying to add satisfying tuples to sum constraint ", self)
+
+    def check(self, vals):
+        return sum(vals) == self.total
+
+    def bounds(self):
+        """Return (min, max) of the sum over the current domains of the scope."""
+        lo = 0
+        hi = 0
+        for var in self.scope:
+            dom = var.getCurDomain()
+            lo += min(dom)
+            hi += max(dom)
+        return lo, hi
+
+    def hasSupport(self, var, val):
+        if not var.isInCurDomain(val):
+            return False
+        lo, hi = self.bounds()
+        dom = var.getCurDomain()
+        return lo - min(dom) + val <= self.total <= hi - max(dom) + val
+
+    def revise(self, pruned):
+        """Constraint.revise with the bounds computed once and kept up to date as values go:
+        a value of var is supported when it lies in [total - (hi - max), total - (lo - min)]."""
+        lo, hi = self.bounds()
+        changed = []
+        revised = True
+        while revised:
+            revised = False
+            for var in self.scope:
+                dom = var.getCurDomain()
+                low = min(dom)
+                high = max(dom)
+                first = self.total - hi + high
+                last = self.total - lo + low
+                if first <= low and high <= last:
+                    continue
+                for val in dom:
+                    if val < first or val > last:
+                        var.pruneValue(val)
+                        pruned.append((var, val))
+                if var not in changed:
+                    changed.append(var)
+                # Losing the assigned value is a wipe out as well.
+                if var.isAssigned() or not var.getCurDomainSize():
+                    return False, changed
+                revised = True
+                dom = var.getCurDomain()
+                lo += min(dom) - low
+                hi += max(dom) - high
+        return True, changed
+
+    def __str__(self):
+        return "{}({} = {})".format(self.name, [var.name for var in self.scope], self.total)
+
+
+def swapRemove(items, positions, item):
+    """Remove item from the list items in O(1), positions maps the items to their index."""
+    k = positions.pop(item)
+    last = items.pop()
+    if last is not item:
+        items[k] = last
+        positions[last] = k
+
+
 class CSP:
     def __init__(self, name, variables=None):
         if variables is None:
@@ -166,6 +303,13 @@ class CSP:
         self.vars = []
         self.cons = []
         self.vars_to_cons = dict()
+
+        # Positions in vars and cons, so removing one is O(1): the last one takes its place.
+        self.varPos = dict()
+        self.conPos = dict()
+
+        # Constraint of the last domain wipe out, set by the propagators for BT.
+        self.lastWipeout = None
         for v in variables:
             self.addVariable(v)
 
@@ -175,11 +319,12 @@ class CSP:
         elif v in self.vars_to_cons:
             print("Trying to add variable ", v, " to CSP object that already has it")
         else:
+            self.varPos[v] = len(self.vars)
             self.vars.append(v)
             self.vars_to_cons[v] = []
 
     def addConstraint(self, c):
-        if not type(c) is Constraint:
+        if not isinstance(c, Constraint):
             print("Trying to add non constraint ", c, " to CSP object")
         else:
             for v in c.scope:
@@ -187,8 +332,22 @@ class CSP:
                     print("Trying to add constraint ", c, " with unknown variables to CSP object")
                     return
                 self.vars_to_cons[v].append(c)
+            self.conPos[c] = len(self.cons)
             self.cons.append(c)
 
+    def removeVariable(self, v):
+        """Remove a variable that no constraint uses anymore."""
+        if self.vars_to_cons.get(v):
+            print("Trying to remove variable ", v, " that is still in a constraint scope")
+        elif v in self.vars_to_cons:
+            swapRemove(self.vars, self.varPos, v)
+            del self.vars_to_cons[v]
+
+    def removeConstraint(self, c):
+        for v in c.scope:
+            self.vars_to_cons[v].remove(c)
+        swapRemove(self.cons, self.conPos, c)
+
     def getAllConstraints(self):
         """return list of all constraints in the CSP"""
         return self.cons
@@ -201,6 +360,37 @@ class CSP:
         """return list of variables in the CSP"""
         return list(self.vars)
 
+    def getComponents(self, variables=None):
+        """Split the CSP into its connected components, two variables are connected when they
+        share a constraint. With variables only the components containing one of them are built.
+        Return a list of CSP objects sharing this CSP's variables and constraints."""
+        components = []
+        seen = set()
+        seenCons = set()
+        for v in self.vars if variables is None else variables:
+            if v in seen or v not in self.vars_to_cons:
+                continue
+            component = CSP("{}-{}".format(self.name, len(components)))
+            cons = []
+            seen.add(v)
+            stack = [v]
+            while stack:
+                var = stack.pop()
+                component.addVariable(var)
+                for c in self.vars_to_cons[var]:
+                    if c in seenCons:
+                        continue
+                    seenCons.add(c)
+                    cons.append(c)
+                    for other in c.scope:
+                        if other not in seen:
+                            seen.add(other)
+                            stack.append(other)
+            for c in cons:
+                component.addConstraint(c)
+            components.append(component)
+        return components
+
     def printAll(self):
         print("CSP", self.name)
         print("   Variables = ", self.vars)
@@ -213,6 +403,300 @@ class CSP:
         print("")
 
 
+##################################
+##### Component Decomposition ####
+##################################
+
+def findBackbone(csp, propagator, ordering=None, names=None):
+    """Find the backbone of csp, the variables that take the same value in every solution.
+
+    A first search gives a solution, its values are the candidates. Each candidate still in
+    doubt is then refuted on its own: its value is pruned and the search looks for a solution
+    without it. If there is none the value is in the backbone, and it stays fixed for the
+    checks that follow so they search a smaller problem. A solution that is found is a witness
+    for every variable it gives another value, all of those leave the candidates without a
+    search of their own, and the search tries the candidate values last so that every witness
+    takes as many candidates as it can.
+    With names, a set of variable names, only those variables are checked.
+    Return (backbone values in the order of csp.vars, None for a variable outside it or not
+    checked, nDecisions, nPrunes). The values are all None when csp has no solution. Domains are left
+    as they were."""
+    solver = BT(csp, ordering)
+    solver.quiet = True
+    counts = [0, 0]
+
+    def search():
+        # A successful search leaves the prunes made on its way down, put the domains back.
+        domains = [v.curDomain for v in csp.vars]
+        solver.backtrackingSearch(propagator)
+        counts[0] += solver.nDecisions
+        counts[1] += solver.nPrunes
+        if not solver.solved:
+            return None
+        solution = [v.getAssignedValue() for v in csp.vars]
+        for var, domain in zip(csp.vars, domains):
+            if var.isAssigned():
+                var.unassign()
+            var.curDomain = domain
+        return solution
+
+    backbone = [None] * len(csp.vars)
+    solution = search()
+    if solution is None:
+        return backbone, counts[0], counts[1]
+
+    # Variables assigned before the first free choice hold in every solution (see BT.forced).
+    forced = set(solver.forced)
+    candidates = {k: v for k, v in enumerate(solution)
+                  if csp.vars[k] not in forced and (names is None or csp.vars[k].name in names)}
+    solver.avoid = {csp.vars[k]: v for k, v in candidates.items()}
+    fixed = []
+    for k, var in enumerate(csp.vars):
+        if var in forced:
+            # Fixed either way so the checks search a smaller problem, reported only if asked for.
+            if names is None or var.name in names:
+                backbone[k] = solution[k]
+            for other in var.getCurDomain():
+                if other != solution[k]:
+                    var.pruneValue(other)
+                    fixed.append((var, other))
+
+    for k, var in enumerate(csp.vars):
+        if k not in candidates:
+            continue
+        value = candidates.pop(k)
+        del solver.avoid[var]
+        var.pruneValue(value)
+        witness = search() if var.getCurDomainSize() else None
+        var.depruneValue(value)
+
+        if witness is None:
+            backbone[k] = value
+            for other in var.getCurDomain():
+                if other != value:
+                    var.pruneValue(other)
+                    fixed.append((var, other))
+        else:
+            for j in [j for j, v in candidates.items() if witness[j] != v]:
+                del candidates[j]
+                del solver.avoid[csp.vars[j]]
+
+    restoreValues(fixed)
+    if instrument.enabled:
+        instrument.count("backboneVars", sum(1 for v in backbone if v is not None))
+    return backbone, counts[0], counts[1]
+
+
+def backboneComponents(csp, propagator, executor=None, minPoolSize=32, ordering=None, names=None,
+                       variables=None):
+    """Backbone of each connected component of csp, see findBackbone (names is passed on to it).
+    With variables only the components containing one of them are searched, see CSP.getComponents.
+    With a concurrent.futures executor, components with at least minPoolSize variables are done there.
+    Return (list of (variable, value) in the backbone, nDecisions, nPrunes)."""
+    backbone = []
+    nDecisions = 0
+    nPrunes = 0
+    done = []
+    futures = []
+    for component in csp.getComponents(variables):
+        checked = None if names is None else set(v.name for v in component.vars if v.name in names)
+        if executor is not None and len(component.vars) >= minPoolSize:
+            futures.append((component, executor.submit(findBackbone, component, propagator, ordering, checked)))
+        else:
+            done.append((component, findBackbone(component, propagator, ordering, checked)))
+    done.extend((component, future.result()) for component, future in futures)
+
+    for component, (values, decisions, prunes) in done:
+        backbone.extend((var, val) for var, val in zip(component.vars, values) if val is not None)
+        nDecisions += decisions
+        nPrunes += prunes
+    return backbone, nDecisions, nPrunes
+
+
+##################################
+####### Variable Ordering ########
+##################################
+
+class IndexedHeap:
+    """Binary min-heap of items with a position index, so that the priority of any item
+    can be changed, or the item removed, in O(log n)."""
+
+    def __init__(self):
+        self.heap = []
+        self.pos = dict()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item):
+        return item in self.pos
+
+    def push(self, item, key):
+        self.heap.append((key, item))
+        self.pos[item] = len(self.heap) - 1
+        self.siftUp(len(self.heap) - 1)
+
+    def pop(self):
+        """Remove and return the item with the smallest key."""
+        item = self.heap[0][1]
+        self.remove(item)
+        return item
+
+    def peek(self):
+        return self.heap[0][1]
+
+    def remove(self, item):
+        i = self.pos.pop(item)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.pos[last[1]] = i
+            self.siftUp(i)
+            self.siftDown(self.pos[last[1]])
+
+    def update(self, item, key):
+        i = self.pos[item]
+        old = self.heap[i][0]
+        if key == old:
+            return
+        self.heap[i] = (key, item)
+        if key < old:
+            self.siftUp(i)
+        else:
+            self.siftDown(i)
+
+    def siftUp(self, i):
+        heap = self.heap
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not entry[0] < heap[parent][0]:
+                break
+            heap[i] = heap[parent]
+            self.pos[heap[i][1]] = i
+            i = parent
+        heap[i] = entry
+        self.pos[entry[1]] = i
+
+    def siftDown(self, i):
+        heap = self.heap
+        n = len(heap)
+        entry = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if not heap[child][0] < entry[0]:
+                break
+            heap[i] = heap[child]
+            self.pos[heap[i][1]] = i
+            i = child
+        heap[i] = entry
+        self.pos[entry[1]] = i
+
+
+class VariableOrdering:
+    """Chooses the next variable for BT from an indexed heap of the unassigned variables.
+    Forced variables come first: those with one value left in curDomain, or the last
+    unassigned variable of a constraint. The others are ordered by key(var), ties by
+    their position in csp.vars. Subclasses override key."""
+
+    def __init__(self, csp):
+        self.csp = csp
+        self.heap = IndexedHeap()
+        self.order = {v: n for n, v in enumerate(csp.vars)}
+        # constraint -> number of its variables not yet extracted
+        self.unassignedCount = dict()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def start(self, variables):
+        """Fill the heap with the variables left to assign."""
+        pending = set(variables)
+        for c in self.csp.getAllConstraints():
+            self.unassignedCount[c] = sum(1 for v in c.scope if v in pending)
+        for v in variables:
+            self.heap.push(v, self.priority(v))
+
+    def priority(self, var):
+        return 0 if self.isForced(var) else 1, self.key(var), self.order[var]
+
+    def isForced(self, var):
+        if var.getCurDomainSize() == 1:
+            return True
+        for c in self.csp.vars_to_cons[var]:
+            if self.unassignedCount[c] == 1:
+                return True
+        return False
+
+    def isDetermined(self, var):
+        """Whether var has one value left given the variables assigned so far: one value in
+        curDomain, or the last unassigned variable of a sum constraint. The last variable of a
+        table constraint may still have several values that fit."""
+        if var.getCurDomainSize() == 1:
+            return True
+        for c in self.csp.vars_to_cons[var]:
+            if self.unassignedCount[c] == 1 and isinstance(c, SumConstraint):
+                return True
+        return False
+
+    def key(self, var):
+        return 0
+
+    def extract(self):
+        """Remove and return the next variable to assign."""
+        var = self.heap.pop()
+        self.countChanged(var, -1)
+        return var
+
+    def restore(self, var):
+        """Put a variable back after search backtracked over it."""
+        self.countChanged(var, 1)
+        self.heap.push(var, self.priority(var))
+
+    def countChanged(self, var, delta):
+        for c in self.csp.vars_to_cons[var]:
+            self.unassignedCount[c] += delta
+            for v in c.scope:
+                self.refresh(v)
+
+    def refresh(self, var):
+        """Recompute the priority of var after its domain or its constraints changed."""
+        if var in self.heap:
+            self.heap.update(var, self.priority(var))
+
+    def bump(self, con):
+        """A constraint's weight changed."""
+        for v in con.scope:
+            self.refresh(v)
+
+
+class MRVOrdering(VariableOrdering):
+    """Minimum remaining values."""
+
+    def key(self, var):
+        return var.getCurDomainSize()
+
+
+class DegreeOrdering(VariableOrdering):
+    """Most constraints with other unassigned variables first."""
+
+    def key(self, var):
+        return -sum(1 for c in self.csp.vars_to_cons[var] if self.unassignedCount[c] > 1)
+
+
+class DomWDegOrdering(VariableOrdering):
+    """Smallest domain size over the summed weight of the constraints with other
+    unassigned variables, weights grow with each wipe out a constraint causes."""
+
+    def key(self, var):
+        wdeg = sum(c.weight for c in self.csp.vars_to_cons[var] if self.unassignedCount[c] > 1)
+        return var.getCurDomainSize() / max(wdeg, 1)
+
+
 ##################################
 ###### Backtracking Routine ######
 ##################################
@@ -225,8 +709,7 @@ def restoreValues(prunes):
 
 
 class BT:
-    def __init__(self, csp):
-        self.unassignedVars = []
+    def __init__(self, csp, ordering=None):
         self.csp = csp
         self.nDecisions = 0
 
@@ -234,6 +717,22 @@ class BT:
         self.TRACE = False
         self.runtime = 0
 
+        # Whether the last search found a solution, and whether to keep quiet when it did not.
+        self.solved = False
+        self.quiet = False
+
+        # Optional dict variable -> value the search tries last for that variable.
+        self.avoid = None
+
+        # VariableOrdering subclass used to pick variables, MRVOrdering by default.
+        self.orderingClass = ordering if ordering is not None else MRVOrdering
+        self.ordering = None
+
+        # Variables assigned before the first free choice of the search, each determined by the
+        # ones before it (see VariableOrdering.isDetermined), so they hold in every solution.
+        self.forced = []
+        self.inForcedPrefix = True
+
     def traceOn(self):
         """Turn search trace on"""
         self.TRACE = True
@@ -260,8 +759,18 @@ class BT:
             var.restoreCurDomain()
 
     def restoreUnassignedVar(self, var):
-        """Add variable back to list of unassigned vars"""
-        self.unassignedVars.append(var)
+        """Add variable back to the unassigned vars"""
+        self.ordering.restore(var)
+        if self.forced and self.forced[-1] is var:
+            self.forced.pop()
+
+    def refreshPrunes(self, prunes):
+        """Update the variable ordering after the domains of pruned variables changed."""
+        for var, val in prunes:
+            self.ordering.refresh(var)
+        if self.csp.lastWipeout is not None:
+            self.ordering.bump(self.csp.lastWipeout)
+            self.csp.lastWipeout = None
 
     ##################################
     ###### BACKTRACKING SEARCH #######
@@ -270,30 +779,40 @@ class BT:
     def backtrackingSearch(self, propagator):
         self.clearStatistics()
 
-        # sTime = time.process_time()
+        sTime = time.perf_counter()
 
-        for v in self.csp.vars:
-            if not v.isAssigned():
-                self.unassignedVars.append(v)
+        self.forced = []
+        self.inForcedPrefix = True
+        self.csp.lastWipeout = None
+        self.ordering = self.orderingClass(self.csp)
 
         status, prunes = propagator(self.csp)  # initial propagate no assigned variables.
         self.nPrunes = self.nPrunes + len(prunes)
 
+        self.ordering.start([v for v in self.csp.vars if not v.isAssigned()])
+
         if self.TRACE:
-            print(len(self.unassignedVars), " unassigned variables at start of search")
+            print(len(self.ordering), " unassigned variables at start of search")
             print("Root Prunes: ", prunes)
 
         if not status:
-            print("CSP{} detected contradiction at root".format(
-                self.csp.name))
+            if not self.quiet:
+                print("CSP{} detected contradiction at root".format(
+                    self.csp.name))
         else:
             status = self.backtrackingRecursion(propagator, 1)  # now do recursive search
 
         restoreValues(prunes)
-        if not status:
+        self.solved = status
+        if not status and not self.quiet:
             print("CSP{} unsolved. Has no solutions".format(self.csp.name))
 
-        # sTime = sTime - time.process_time()
+        self.runtime = time.perf_counter() - sTime
+        if instrument.enabled:
+            instrument.stop("search", sTime)
+            instrument.count("searches")
+            instrument.count("nDecisions", self.nDecisions)
+            instrument.count("nPrunes", self.nPrunes)
         return self.nDecisions
 
     def backtrackingRecursion(self, propagator, level):
@@ -301,16 +820,20 @@ class BT:
         if self.TRACE:
             print('  ' * level, "bt_recurse level ", level)
 
-        if not self.unassignedVars:
+        if not len(self.ordering):
             return True
         else:
             var = self.extractVariable()
-            if not var:
-                return True
             if self.TRACE:
                 print('  ' * level, "bt_recurse var = ", var)
 
-            for val in var.getCurDomain():
+            values = var.getCurDomain()
+            if self.avoid:
+                avoid = self.avoid.get(var)
+                if avoid is not None and len(values) > 1 and avoid in values:
+                    values = [val for val in values if val != avoid] + [avoid]
+
+            for val in values:
 
                 if self.TRACE:
                     print('  ' * level, "bt_recurse trying", var, "=", val)
@@ -320,6 +843,7 @@ class BT:
 
                 status, prunes = propagator(self.csp, var)
                 self.nPrunes = self.nPrunes + len(prunes)
+                self.refreshPrunes(prunes)
 
                 if self.TRACE:
                     print('  ' * level, "bt_recurse prop status = ", status)
@@ -332,23 +856,20 @@ class BT:
                 if self.TRACE:
                     print('  ' * level, "bt_recurse restoring ", prunes)
                 restoreValues(prunes)
+                self.refreshPrunes(prunes)
                 var.unassign()
 
             self.restoreUnassignedVar(var)
             return False
 
     def extractVariable(self):
-        """Remove variable from list of unassigned vars."""
-        for var in self.unassignedVars:
-            if var.getCurDomainSize() == 1:
-                self.unassignedVars.remove(var)
-                return var
-
-        for con in self.csp.getAllConstraints():
-            if con.getNumberOfUnassignedVars() == 0:
-                continue
-            if con.getNumberOfUnassignedVars() == 1:
-                mv = con.getUnassignedVars()[0]
-                self.unassignedVars.remove(mv)
-                return mv
-        return None
+        """Remove the next variable from the unassigned vars, None only when there is none left."""
+        if not len(self.ordering):
+            return None
+        var = self.ordering.heap.peek()
+        if self.inForcedPrefix:
+            if self.ordering.isDetermined(var):
+                self.forced.append(var)
+            else:
+                self.inForcedPrefix = False
+        return self.ordering.extract()
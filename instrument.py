@@ -0,0 +1,93 @@
+"""Per-phase timers and counters for the solver pipeline.
+
+Off by default. Hooks are written as
+
+    timed = instrument.enabled
+    if timed:
+        t = instrument.start()
+    ...
+    if timed:
+        instrument.stop("phase", t)
+
+so when off each hook costs one attribute check. enabled is read once, so switching it while
+a hook runs (from another thread) cannot leave a stop without its start. Phases may nest
+(search includes the propagator calls it makes). Every finished solve step or guess becomes
+one record holding the phases and counters since the previous record, see endStep and dump."""
+import json
+import time
+
+enabled = False
+
+# name -> [calls, seconds] and name -> count, since the last record
+phases = dict()
+counters = dict()
+
+# finished records, dicts
+records = []
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Drop the pending phases and counters and all records."""
+    phases.clear()
+    counters.clear()
+    del records[:]
+
+
+def start():
+    return time.perf_counter()
+
+
+def stop(name, t):
+    """Add the time since t, from start(), to phase name."""
+    elapsed = time.perf_counter() - t
+    entry = phases.get(name)
+    if entry is None:
+        phases[name] = [1, elapsed]
+    else:
+        entry[0] += 1
+        entry[1] += elapsed
+
+
+def count(name, n=1):
+    counters[name] = counters.get(name, 0) + n
+
+
+def endStep(**fields):
+    """Close the current record, fields are stored along with the phases and counters."""
+    record = dict(fields)
+    record["phases"] = {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in phases.items()}
+    record["counters"] = dict(counters)
+    records.append(record)
+    phases.clear()
+    counters.clear()
+    return record
+
+
+def totals():
+    """Sum phases and counters over all records."""
+    result = {"phases": dict(), "counters": dict()}
+    for record in records:
+        for name, entry in record["phases"].items():
+            total = result["phases"].setdefault(name, {"calls": 0, "seconds": 0.0})
+            total["calls"] += entry["calls"]
+            total["seconds"] += entry["seconds"]
+        for name, n in record["counters"].items():
+            result["counters"][name] = result["counters"].get(name, 0) + n
+    return result
+
+
+def dump(path):
+    """Write the records as JSON lines."""
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
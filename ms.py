@@ -1,13 +1,37 @@
-import random, time
-import msCsp
+import queue
+import threading
+import time
+
+import msBatch
 from BoardButton import *
-from csp import *
+from msEngine import MinesweeperEngine
+from msSolver import Solver
 from props import *
 
-"""LINE 315 TO CHANGE PROPAGATOR"""
+"""Change the propagator passed to Solver in Minesweeper.__init__."""
+
+# How often the window looks for solver results, and how many it applies at a time.
+POLL_MS = 30
+POLL_MESSAGES = 200
+
+
+class QueueRecorder:
+    """Engine recorder (see msEngine) that forwards the moves of a worker's game to the window."""
+
+    def __init__(self, messages, generation):
+        self.messages = messages
+        self.generation = generation
+
+    def move(self, kind, index, source):
+        self.messages.put(("move", self.generation, kind, index, source))
+
+    def layout(self, game):
+        pass
 
 
 class Minesweeper:
+    """Tk view on top of a headless MinesweeperEngine."""
+
     def __init__(self, master):
         self.frame = Frame(master)
         self.frame.configure(background='#181a19')
@@ -18,18 +42,18 @@ class Minesweeper:
         self.win_times = 0
 
         # Board: 10x10 with 10 mines
-        self.row_size = 10
-        self.col_size = 10
-        self.mines_amount = 10
-        self.remaining_mines = self.mines_amount
-        self.flags = 0
-        self.is_over = False
+        self.game = MinesweeperEngine(10, 10, 10)
+        self.solver = Solver(self.game, prop_BT)
         self.buttons = []
-        self.mines = []
         self.board = []
 
-        self.first_click = True
-        self.first_click_button = None
+        # Background solver: the thread, the queue it reports through and the event that stops it.
+        # Every worker gets a new generation, messages of an older one are dropped unread.
+        self.worker = None
+        self.messages = queue.Queue()
+        self.cancel = threading.Event()
+        self.generation = 0
+        self.stats = {}
 
         # Initialize images for newGame button.
         self.sumWNormal = PhotoImage(file="images/sumW.png")
@@ -51,11 +75,12 @@ class Minesweeper:
         # Read test boards if it's not empty
         if not board:
             self.init_board()
-            # self.init_random_mines()
 
         else:
             self.import_board(board)
 
+        self.game.add_listener(self.cell_changed)
+
         # Initialize newGame button.
         self.newGameButton = Button(self.frame, image=self.sumWNormal,
                                     background='#181a19', foreground='#d10232', highlightbackground='#000000',
@@ -85,19 +110,48 @@ class Minesweeper:
         self.solveButton.grid(row=self.row_size + 3, column=0, columnspan=6, sticky=W)
         self.solveButton.bind("<Button-1>", lambda Button: self.solve_complete_multiple(1000))  # Number of Solves
 
+        # Initialize cancel button and solver stats label.
+        self.cancelButton = Button(self.frame, text="Cancel",
+                                   background='#181a19', foreground='#d10232', highlightbackground='#000000',
+                                   activebackground='#d10232', activeforeground='#181a19')
+        self.cancelButton.grid(row=self.row_size + 3, column=6, columnspan=4, sticky=E)
+        self.cancelButton.bind("<Button-1>", lambda Button: self.cancel_solver())
+        self.stats_label = Label(self.frame, text="",
+                                 background='#181a19', foreground='#d10232', highlightbackground='#000000')
+        self.stats_label.grid(row=self.row_size + 4, column=0, columnspan=self.col_size, sticky=W)
+
+    @property
+    def row_size(self):
+        return self.game.row_size
+
+    @property
+    def col_size(self):
+        return self.game.col_size
+
+    @property
+    def mines_amount(self):
+        return self.game.mines_amount
+
+    @property
+    def remaining_mines(self):
+        return self.game.remaining_mines
+
+    @property
+    def flags(self):
+        return self.game.flags
+
+    @property
+    def is_over(self):
+        return self.game.is_over
+
     def newGame(self):
         """Initialize all attributes for new game."""
+        self.stop_worker()
         self.game_times += 1
-        self.first_click = True
-        self.first_click_button = None
-        self.is_over = False
-        self.flags = 0
-        self.remaining_mines = self.mines_amount
-        self.mines = []
-
-        # Reset all buttons.
+        self.game.new_game()
+
+        # Rebind all buttons.
         for button in self.buttons:
-            button.reset()
             button.bind('<Button-1>', self.lmbWrapper(button))
             button.bind('<Button-3>', self.rmbWrapper(button))
 
@@ -123,50 +177,17 @@ class Minesweeper:
             button.bind('<Button-1>', self.lmbWrapper(button))
             button.bind('<Button-3>', self.rmbWrapper(button))
 
-    def init_random_mines(self):
-        mines = self.mines_amount
-        while mines:
-            buttons = self.get_surrounding_buttons(self.first_click_button.x, self.first_click_button.y)
-            buttons.append(self.first_click_button)
-
-            match = True
-            row = None
-            col = None
-            while match:
-                row = random.choice(range(self.row_size))
-                col = random.choice(range(self.col_size))
-                match = False
-                for b in buttons:
-                    if (row == b.x) and (col == b.y):
-                        match = True
-                        break
-
-            if self.board[row][col].place_mine():
-                self.mines.append(self.board[row][col])
-                self.update_surrounding_buttons(row, col, 1)
-                mines -= 1
+    def cell_changed(self, index):
+        """Engine listener, redraw one cell or the whole board when index is None."""
+        if index is None:
+            for i in range(len(self.buttons)):
+                self.cell_changed(i)
+            return
+        self.buttons[index].sync(self.game.values[index], bool(self.game.visible[index]),
+                                 bool(self.game.flagged[index]))
 
     def get_surrounding_buttons(self, row, col):
-        SURROUNDING = ((-1, -1), (-1, 0), (-1, 1),
-                       (0, -1), (0, 1),
-                       (1, -1), (1, 0), (1, 1))
-
-        neighbours = []
-
-        for pos in SURROUNDING:
-            temp_row = row + pos[0]
-            temp_col = col + pos[1]
-            if 0 <= temp_row < self.row_size and 0 <= temp_col < self.col_size:
-                neighbours.append(self.board[temp_row][temp_col])
-
-        return neighbours
-
-    def update_surrounding_buttons(self, row, col, value):
-        """Update surrounding buttons"""
-        cells = self.get_surrounding_buttons(row, col)
-        for cell in cells:
-            if not cell.is_mine():
-                cell.value += value
+        return [self.board[r][c] for r, c in self.game.get_surrounding_cells(row, col)]
 
     def lmbWrapper(self, button):
         return lambda Button: self.lmbClicked(button)
@@ -175,60 +196,33 @@ class Minesweeper:
         return lambda Button: self.rmbClicked(button)
 
     def lmbClicked(self, button):
-        if self.first_click:
-            self.first_click_button = button
-            self.init_random_mines()
-            self.first_click = False
-
-        if button.is_show() or button.is_flag():
+        if self.worker is not None:
             return
-
-        # Case0: hits a number button
-        button.show()
-
-        # Case1: hits a mine
-        if button.is_mine():
-            button.show_hit_mine()
-            self.newGameButton.config(image=self.sumFailLose)
-            self.gameOver()
-
-        # Case2: hits an empty button
-        elif button.value == 0:
-            buttons = [button]
-            while buttons:
-                temp_button = buttons.pop()
-                surrounding = self.get_surrounding_buttons(temp_button.x, temp_button.y)
-                for neighbour in surrounding:
-                    if not neighbour.is_show() and neighbour.value == 0:
-                        buttons.append(neighbour)
-                    neighbour.show()
-
-        if self.is_win():
+        self.game.reveal(button.x, button.y)
+        if self.is_over:
             self.gameOver()
 
     def rmbClicked(self, button):
-        if button.is_show():
+        if self.worker is not None:
             return
-
-        if button.is_flag():
-            button.flag()
-            self.flags -= 1
-        else:
-            button.flag()
-            self.flags += 1
-
-        self.remaining_mines = (self.mines_amount - self.flags) if self.flags < self.mines_amount else 0
+        self.game.flag(button.x, button.y)
         self.remain_label2.config(text=self.remaining_mines)
-
-        if self.is_win():
+        if self.is_over:
             self.gameOver()
 
     def gameOver(self):
         """Disable all buttons and show all mines."""
-        self.is_over = True
-        for button in self.buttons:
-            if button.is_mine():
-                if not button.is_flag() and not self.is_win():
+        is_win = self.game.is_win()
+        if is_win:
+            self.newGameButton.config(image=self.sumLULWin)
+        else:
+            self.newGameButton.config(image=self.sumFailLose)
+
+        for i, button in enumerate(self.buttons):
+            if self.game.is_mine(i):
+                if i == self.game.hit_mine:
+                    button.show_hit_mine()
+                elif not button.is_flag() and not is_win:
                     button.show()
             elif button.is_flag():
                 button.show_wrong_flag()
@@ -237,120 +231,147 @@ class Minesweeper:
             button.unbind('<Button-3>')
 
     def is_win(self):
-        """The game wins if all buttons are either visible or flagged, and
-        the amount of flags equals the amount of mines. Return True if game wins; False otherwise."""
-        for button in self.buttons:
-            if not button.is_show() and not button.is_mine():
-                return False
-        self.newGameButton.config(image=self.sumLULWin)
-        return True
+        return self.game.is_win()
 
     def solve_complete(self):
-        """Solve current game."""
-        if self.is_over:
+        """Solve current game on a worker thread, its moves are played here as they come in."""
+        if self.is_over or self.worker is not None:
             return
 
-        for button in self.buttons:
-            if button.is_flag():
-                button.flag()
-                self.flags -= 1
-        while not self.is_over:
-            assigned = self.solve_step()
-
-            if not assigned:
-                choose_button = self.guess_move()
-                self.lmbClicked(choose_button)
-
-    def solve_complete_multiple(self, times):
-        self.win_times = 0
-        self.game_times = 0
-        print(
-            "board size: {0}x{1}\nmines #: {2}\n{3}".format(self.row_size, self.col_size, self.mines_amount, "-" * 27))
-        runTime = time.time()
-        indTimes = []
-        for i in range(times):
-            thisTestTime = time.time()
-            self.solve_complete()
-            if self.is_win():
-                self.win_times += 1
-            self.newGame()
-            if (i + 1) % 100 == 0:
-                print("solved: " + str(i + 1) + " times")
-            indTimes.append(time.time() - thisTestTime)
-
-        runTime = time.time() - runTime
-        avgTime = 0
-        for i in indTimes:
-            avgTime += i
-        avgTime = avgTime / len(indTimes)
-        print("-------Run results---------")
-        print("Matches played: " + str(self.game_times))
-        print("Wins: " + str(self.win_times))
-        print("Win rate: " + str(self.win_times / self.game_times))
-        print("Avg. Solve Times: ", avgTime)
-        print("Total Time: " + str(runTime))
-        self.win_times = 0
-        self.game_times = 0
-
-    def guess_move(self):
-        buttons = []
-        corners = [self.board[0][0], self.board[0][self.col_size - 1], self.board[self.row_size - 1][0],
-                   self.board[self.row_size - 1][self.col_size - 1]]
-        for button in self.buttons:
-            if not button.is_show() and not button.is_flag():
-                buttons.append(button)
-
-        for button in corners:
-            if not button.is_show() and not button.is_flag():
-                return button
+        # Mines are placed by the first click, make it here so the worker's copy has them.
+        if self.game.first_click:
+            row, col = self.solver.guess_move()
+            self.game.reveal(row, col, source="guess")
+            if self.is_over:
+                self.gameOver()
+                return
 
-        return random.choice(buttons)
+        self.stats = {"kind": "game", "moves": 0, "guesses": 0, "start": time.perf_counter()}
+        self.start_worker(self.run_solver, self.game.copy())
 
-    def solve_step(self):
-        is_assigned = False
+    def run_solver(self, generation, cancel, game):
+        game.recorder = QueueRecorder(self.messages, generation)
+        solver = Solver(game, self.solver.propagator, ordering=self.solver.ordering)
+        solver.solve_complete(cancel)
+        self.messages.put(("done", generation, solver.nDecisions, solver.nPrunes))
 
-        csp = msCsp.cspModel(self)
+    def solve_complete_multiple(self, times):
+        """Play times seeded games headless across a process pool on a worker thread, show the
+        progress and print the report."""
+        if self.worker is not None:
+            return
+        self.stats = {"kind": "batch", "played": 0, "games": times, "wins": 0, "start": time.perf_counter()}
+        self.start_worker(self.run_batch, times, self.game.random.getrandbits(32))
+
+    def run_batch(self, generation, cancel, times, seed):
+        # The pool is started from this thread of a Tk process, spawn keeps the children clean.
+        report = msBatch.runBatch(times, self.row_size, self.col_size, self.mines_amount, seed=seed,
+                                  propagator=self.solver.propagator, ordering=self.solver.ordering,
+                                  cancel=cancel, context="spawn",
+                                  progress=lambda played, games, wins: self.messages.put(
+                                      ("progress", generation, played, wins)))
+        self.messages.put(("report", generation, report))
+
+    def start_worker(self, target, *args):
+        self.generation += 1
+        self.cancel = threading.Event()
+        self.worker = threading.Thread(target=target, args=(self.generation, self.cancel) + args, daemon=True)
+        self.worker.start()
+        self.frame.after(POLL_MS, self.poll_worker, self.generation)
+
+    def cancel_solver(self):
+        self.cancel.set()
+
+    def stop_worker(self):
+        """Cancel the worker and forget it without waiting, what it still reports is dropped."""
+        if self.worker is None:
+            return
+        self.cancel.set()
+        self.worker = None
+        self.generation += 1
 
-        solver = BT(csp)
-        solver.backtrackingSearch(prop_BT)
-        for var in csp.getAllVariables():
+    def poll_worker(self, generation):
+        """Apply what the worker of generation reported since the last call, called through after()."""
+        if self.worker is None or generation != self.generation:
+            return
+        for _ in range(POLL_MESSAGES):
             try:
-                cell = var.name.split()
-                row = int(cell[0])
-                col = int(cell[1])
-            except:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if message[1] != generation:
                 continue
 
-            if var.getAssignedValue() == 1:
-                if not self.board[row][col].is_flag():
-                    self.rmbClicked(self.board[row][col])
-                    is_assigned = True
-            elif var.getAssignedValue() == 0:
-                if not self.board[row][col].is_show():
-                    self.lmbClicked(self.board[row][col])
-                    is_assigned = True
+            if message[0] == "move":
+                kind, index, source = message[2:]
+                row, col = self.game.coords(index)
+                if kind == "reveal":
+                    self.game.reveal(row, col, source)
+                else:
+                    self.game.flag(row, col, source)
+                self.stats["moves"] += 1
+                if source == "guess":
+                    self.stats["guesses"] += 1
+            elif message[0] == "progress":
+                self.stats["played"], self.stats["wins"] = message[2:]
+            elif message[0] == "done":
+                self.worker = None
+                self.stats["cancelled"] = not self.is_over
+                self.remain_label2.config(text=self.remaining_mines)
+                self.show_stats()
+                if self.is_over:
+                    self.gameOver()
+                return
+            elif message[0] == "report":
+                self.worker = None
+                self.stats["cancelled"] = message[2]["cancelled"]
+                self.show_stats()
+                msBatch.printReport(message[2])
+                self.newGame()
+                self.win_times = 0
+                self.game_times = 0
+                return
+
+        self.remain_label2.config(text=self.remaining_mines)
+        self.show_stats()
+        self.frame.after(POLL_MS, self.poll_worker, generation)
+
+    def show_stats(self):
+        stats = self.stats
+        elapsed = time.perf_counter() - stats["start"]
+        if stats["kind"] == "game":
+            text = "moves: {0}  guesses: {1}  {2:.1f} s".format(stats["moves"], stats["guesses"], elapsed)
+        else:
+            text = "games: {0}/{1}  wins: {2}  {3:.1f} s".format(stats["played"], stats["games"], stats["wins"],
+                                                                  elapsed)
+        if stats.get("cancelled"):
+            text += "  (cancelled)"
+        self.stats_label.config(text=text)
 
+    def guess_move(self):
+        row, col = self.solver.guess_move()
+        return self.board[row][col]
+
+    def solve_step(self):
+        if self.worker is not None:
+            return False
+        is_assigned = self.solver.solve_step()
+        self.remain_label2.config(text=self.remaining_mines)
+        if self.is_over:
+            self.gameOver()
         return is_assigned
 
     def import_board(self, board):
-        """Import game from a list of lists with numbers."""
-        self.row_size = len(board)
-        self.col_size = len(board[0])
+        """Import game from a list of lists with numbers or a board read with msCorpus."""
+        self.game.import_board(board)
 
-        self.mines_amount = 0
-
-        self.flags = 0
         self.buttons = []
-        self.mines = []
         self.board = []
 
         for row in range(self.row_size):
             lis = []
             for col in range(self.col_size):
-                button = BoardButton(row, col, self.frame, self.images, board[row][col])
-                if button.is_mine():
-                    self.mines.append(button)
-                    self.mines_amount += 1
+                button = BoardButton(row, col, self.frame, self.images, self.game.values[self.game.index(row, col)])
 
                 # first row grid for new game button
                 button.grid(row=row + 1, column=col)
@@ -360,8 +381,6 @@ class Minesweeper:
                 self.buttons.append(button)
             self.board.append(lis)
 
-        self.remaining_mines = self.mines_amount
-
 
 def setupMenu(root, minesweeper):
     menubar = Menu(root, background='#181a19', foreground='#d10232', borderwidth=0,
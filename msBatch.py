@@ -0,0 +1,229 @@
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import msCache
+import msCorpus
+import msLog
+from csp import DegreeOrdering, DomWDegOrdering, MRVOrdering
+from msEngine import MinesweeperEngine
+from msSolver import Solver
+from props import *
+
+
+def deriveSeeds(seed, games):
+    """One seed per game, derived from the batch seed so that any game can be replayed alone."""
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(games)]
+
+
+ORDERINGS = {"MRV": MRVOrdering, "degree": DegreeOrdering, "domwdeg": DomWDegOrdering}
+
+
+def playGame(seed, row_size, col_size, mines_amount, propagator=prop_GAC, cache=None, log=None, ordering=None):
+    """Play one seeded game headless. Return (won, seconds, nDecisions, nPrunes).
+    cache is an optional msCache.ComponentCache, shared by the games of a shard, log an
+    optional msLog.MoveLog the game is written to and ordering the Solver's variable ordering."""
+    game = MinesweeperEngine(row_size, col_size, mines_amount, seed=seed)
+    if log is not None:
+        log.attach(game)
+    return playEngine(game, propagator, cache, log, ordering)
+
+
+def playBoard(board, seed, propagator=prop_GAC, cache=None, log=None, ordering=None):
+    """Play a board from msCorpus, starting at its first click when it has one. seed only
+    drives the random fallback guesses. Return as playGame."""
+    game = MinesweeperEngine(seed=seed)
+    game.import_board(board)
+    if log is not None:
+        log.attach(game)
+    if board.first_cell is not None:
+        game.reveal(*game.coords(board.first_cell))
+    return playEngine(game, propagator, cache, log, ordering)
+
+
+def playEngine(game, propagator, cache, log, ordering=None):
+    solver = Solver(game, propagator, cache=cache, ordering=ordering)
+    start = time.perf_counter()
+    solver.solve_complete()
+    seconds = time.perf_counter() - start
+    if log is not None:
+        log.end(game)
+    return game.is_win(), seconds, solver.nDecisions, solver.nPrunes
+
+
+def playShard(seeds, row_size, col_size, mines_amount, propagator, cacheBytes=None, corpus=None, boards=None,
+              logPath=None, ordering=None):
+    """Play seeds in order, or with corpus (a path) the corpus boards at indices boards.
+    With logPath the games are appended to that msLog file. Return (results, cache stats or None)."""
+    cache = msCache.ComponentCache(cacheBytes) if cacheBytes else None
+    log = msLog.MoveLog(logPath) if logPath else None
+    if corpus is None:
+        results = [playGame(seed, row_size, col_size, mines_amount, propagator, cache, log, ordering)
+                   for seed in seeds]
+    else:
+        with msCorpus.CorpusReader(corpus) as reader:
+            results = [playBoard(reader[k], seed, propagator, cache, log, ordering)
+                       for k, seed in zip(boards, seeds)]
+    if log is not None:
+        log.close()
+    return results, cache.stats() if cache is not None else None
+
+
+def logPath(log, shard):
+    return None if log is None else "{0}.{1}".format(log, shard)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0
+    k = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+def runBatch(games, row_size=10, col_size=10, mines_amount=10, seed=0, workers=None,
+             propagator=prop_GAC, shards=None, cacheBytes=None, corpus=None, log=None, progress=None,
+             cancel=None, ordering=None, context=None):
+    """Play games across a process pool and return an aggregated report dict.
+    workers defaults to the number of cores, workers=1 plays in this process.
+    Games are split into shards, several per worker so that slow games even out.
+    With cacheBytes every shard keeps a component cache of that size, see msCache.
+    With corpus, the path of an msCorpus file, its first games boards are played (all of them
+    when games is None) and the board size and mines come from the file.
+    With log, shard k appends its games to the msLog file log + ".k".
+    ordering is the csp.VariableOrdering subclass of the solvers, MRVOrdering when None.
+    context is the multiprocessing start method of the pool ("spawn", "fork", ...), the platform
+    default when None.
+    progress(games played, games, wins) is called as shards finish. Once cancel, a
+    threading.Event, is set no more shards are started and the report covers the games played."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if corpus is not None:
+        with msCorpus.CorpusReader(corpus) as reader:
+            row_size, col_size, mines_amount = reader.row_size, reader.col_size, reader.mines_amount
+            games = len(reader) if games is None else min(games, len(reader))
+    seeds = deriveSeeds(seed, games)
+    if shards is None:
+        shards = min(games, workers * 4) or 1
+    boards = list(range(games))
+    chunks = [(seeds[k::shards], boards[k::shards]) for k in range(shards)]
+
+    runTime = time.perf_counter()
+    shardResults = []
+    played = [0, 0]
+
+    def finished(shard):
+        shardResults.append(shard)
+        played[0] += len(shard[0])
+        played[1] += sum(1 for result in shard[0] if result[0])
+        if progress is not None:
+            progress(played[0], games, played[1])
+
+    if workers == 1:
+        for k, (chunk, indices) in enumerate(chunks):
+            if cancel is not None and cancel.is_set():
+                break
+            finished(playShard(chunk, row_size, col_size, mines_amount, propagator, cacheBytes,
+                               corpus, indices, logPath(log, k), ordering))
+    else:
+        mp_context = multiprocessing.get_context(context) if context is not None else None
+        with ProcessPoolExecutor(workers, mp_context=mp_context) as executor:
+            futures = [executor.submit(playShard, chunk, row_size, col_size, mines_amount, propagator, cacheBytes,
+                                       corpus, indices, logPath(log, k), ordering)
+                       for k, (chunk, indices) in enumerate(chunks)]
+            for future in futures:
+                if cancel is not None and cancel.is_set():
+                    future.cancel()
+                    if future.cancelled():
+                        continue
+                finished(future.result())
+    runTime = time.perf_counter() - runTime
+
+    results = []
+    cache = None
+    for shard, stats in shardResults:
+        results.extend(shard)
+        if stats is not None:
+            if cache is None:
+                cache = {"hits": 0, "misses": 0, "evictions": 0}
+            for name in cache:
+                cache[name] += stats[name]
+    if cache is not None:
+        lookups = cache["hits"] + cache["misses"]
+        cache["hit_rate"] = cache["hits"] / lookups if lookups else 0
+
+    wins = sum(1 for won, seconds, decisions, prunes in results if won)
+    times = sorted(seconds for won, seconds, decisions, prunes in results)
+    return {
+        "board": [row_size, col_size],
+        "mines": mines_amount,
+        "seed": seed,
+        "corpus": corpus,
+        "workers": workers,
+        "propagator": propagator.__name__,
+        "ordering": (ordering or MRVOrdering).__name__,
+        "games": len(results),
+        "cancelled": len(results) < games,
+        "wins": wins,
+        "win_rate": wins / len(results) if results else 0,
+        "latency": {
+            "mean": sum(times) / len(times) if times else 0,
+            "p50": percentile(times, 50),
+            "p90": percentile(times, 90),
+            "p99": percentile(times, 99),
+            "max": times[-1] if times else 0,
+        },
+        "nDecisions": sum(r[2] for r in results),
+        "nPrunes": sum(r[3] for r in results),
+        "total_time": runTime,
+        "games_per_second": len(results) / runTime if runTime else 0,
+        "cache": cache,
+    }
+
+
+def printReport(report):
+    print("board size: {0}x{1}\nmines #: {2}\n{3}".format(report["board"][0], report["board"][1],
+                                                        report["mines"], "-" * 27))
+    print("-------Run results---------")
+    print("Matches played: " + str(report["games"]))
+    print("Wins: " + str(report["wins"]))
+    print("Win rate: " + str(report["win_rate"]))
+    print("Avg. Solve Times: ", report["latency"]["mean"])
+    print("Solve Time p50/p90/p99/max: {p50:.4f} / {p90:.4f} / {p99:.4f} / {max:.4f}".format(**report["latency"]))
+    print("Decisions: {0}  Prunes: {1}".format(report["nDecisions"], report["nPrunes"]))
+    print("Total Time: " + str(report["total_time"]))
+    print("Seed: {0}  Workers: {1}  Games/s: {2:.1f}".format(report["seed"], report["workers"],
+                                                           report["games_per_second"]))
+    if report.get("cache"):
+        print("Cache hits: {hits}  misses: {misses}  evictions: {evictions}  hit rate: {hit_rate:.3f}".format(
+            **report["cache"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play seeded Minesweeper games across processes.")
+    parser.add_argument("games", type=int, nargs="?", default=1000)
+    parser.add_argument("--size", type=int, nargs=2, default=[10, 10], metavar=("ROWS", "COLS"))
+    parser.add_argument("--mines", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--propagator", choices=["BT", "FC", "GAC", "GAC_cheapest"], default="GAC")
+    parser.add_argument("--ordering", choices=sorted(ORDERINGS), default="MRV", help="variable ordering of the search")
+    parser.add_argument("--corpus", default=None, help="play the boards of an msCorpus file")
+    parser.add_argument("--log", default=None, help="append every game to msLog files LOG.<shard>")
+    parser.add_argument("--cache-mb", type=float, default=0, help="component cache per shard, 0 for none")
+    args = parser.parse_args()
+
+    propagator = {"BT": prop_BT, "FC": prop_FC, "GAC": prop_GAC, "GAC_cheapest": prop_GAC_cheapest}[args.propagator]
+    cacheBytes = int(args.cache_mb * 1024 * 1024) or None
+    printReport(runBatch(args.games, args.size[0], args.size[1], args.mines, args.seed, args.workers, propagator,
+                         cacheBytes=cacheBytes, corpus=args.corpus, log=args.log,
+                         ordering=ORDERINGS[args.ordering]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import msBatch
+import msCsp
+from csp import *
+from msEngine import MinesweeperEngine
+from props import *
+
+# name -> (row_size, col_size, mines_amount)
+LEVELS = {
+    "beginner": (9, 9, 10),
+    "intermediate": (16, 16, 40),
+    "expert": (16, 30, 99),
+}
+
+PROPAGATORS = [prop_BT, prop_FC, prop_GAC, prop_GAC_cheapest]
+
+
+def position(level, seed, steps):
+    """A fixed mid-game position: a seeded game opened in the middle, then steps more safe
+    cells next to the opened area revealed in seeded order. It does not depend on the
+    solver, so the same seed gives the same position on every version of the solver
+    (as long as the board generator in msEngine stays the same)."""
+    row_size, col_size, mines_amount = LEVELS[level]
+    game = MinesweeperEngine(row_size, col_size, mines_amount, seed=seed)
+    rng = random.Random(seed)
+    game.reveal(row_size // 2, col_size // 2)
+    for _ in range(steps):
+        if game.is_over:
+            break
+        cells = [i for i in range(row_size * col_size)
+                 if not game.visible[i] and game.values[i] != -1
+                 and any(game.visible[sur] for sur in game.get_surrounding(i))]
+        if not cells:
+            break
+        game.reveal(*game.coords(rng.choice(cells)))
+    return game
+
+
+def corpus(level, boards, seed=0, steps=3):
+    """Fixed, seeded corpus of positions for a level, games that are already won are skipped."""
+    games = []
+    k = 0
+    while len(games) < boards:
+        game = position(level, seed * 100003 + k, steps)
+        if not game.is_over:
+            games.append(game)
+        k += 1
+    return games
+
+
+def timeit(func, repeat):
+    """Run func repeat times, return the list of seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summary(times):
+    return {"n": len(times), "mean": statistics.mean(times), "median": statistics.median(times),
+            "min": min(times), "max": max(times), "total": sum(times)}
+
+
+def benchModel(games, repeat):
+    times = []
+    for game in games:
+        times.extend(timeit(lambda: msCsp.cspModel(game), repeat))
+    return summary(times)
+
+
+def benchPropagator(games, propagator, repeat):
+    """Root propagation only, domains restored after every run."""
+    times = []
+    for game in games:
+        csp, index = msCsp.cspModel(game)
+
+        def run():
+            status, pruned = propagator(csp)
+            restoreValues(pruned)
+
+        times.extend(timeit(run, repeat))
+    return summary(times)
+
+
+def benchSearch(games, propagator, repeat):
+    times = []
+    for game in games:
+        csp, index = msCsp.cspModel(game)
+        solver = BT(csp)
+
+        def run():
+            solver.backtrackingSearch(propagator)
+            solver.restoreAllVariableDomains()
+
+        times.extend(timeit(run, repeat))
+    return summary(times)
+
+
+def benchGames(level, games, seed, propagator):
+    row_size, col_size, mines_amount = LEVELS[level]
+    times = []
+    wins = 0
+    for game_seed in msBatch.deriveSeeds(seed, games):
+        won, seconds, decisions, prunes = msBatch.playGame(game_seed, row_size, col_size, mines_amount, propagator)
+        wins += won
+        times.append(seconds)
+    result = summary(times)
+    result["win_rate"] = wins / games
+    return result
+
+
+def runBenchmarks(levels=None, boards=20, games=20, repeat=3, seed=0):
+    """Run every benchmark on every level and return the results as a dict."""
+    results = {}
+    for level in levels or LEVELS:
+        positions = corpus(level, boards, seed)
+        results[level] = {
+            "cspModel": benchModel(positions, repeat),
+        }
+        for propagator in PROPAGATORS:
+            results[level][propagator.__name__] = benchPropagator(positions, propagator, repeat)
+        for propagator in PROPAGATORS:
+            results[level]["backtrackingSearch/" + propagator.__name__] = benchSearch(positions, propagator, repeat)
+        results[level]["game/prop_GAC"] = benchGames(level, games, seed, prop_GAC)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "boards": boards,
+            "games": games,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model building, propagators, search and full games.")
+    parser.add_argument("--levels", nargs="+", choices=list(LEVELS), default=list(LEVELS))
+    parser.add_argument("--boards", type=int, default=20, help="positions per level")
+    parser.add_argument("--games", type=int, default=20, help="end to end games per level")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON file, stdout when not given")
+    args = parser.parse_args()
+
+    report = runBenchmarks(args.levels, args.boards, args.games, args.repeat, args.seed)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import sys
+from collections import OrderedDict
+
+import instrument
+import msProbability
+
+# The 8 symmetries of the square grid, (row, col) -> (a * row + b * col, c * row + d * col).
+TRANSFORMS = [
+    (1, 0, 0, 1), (0, 1, -1, 0), (-1, 0, 0, -1), (0, -1, 1, 0),
+    (1, 0, 0, -1), (-1, 0, 0, 1), (0, 1, 1, 0), (0, -1, -1, 0),
+]
+
+
+def canonicalForm(constraints, coords):
+    """Canonical form of a frontier component under rotations, reflections and translation.
+    constraints are (frozenset of cell indices, sum) pairs and coords(cell) gives (row, col).
+    Return (key, cellAt): key is the smallest of the 8 transformed, sorted constraint lists,
+    cellAt maps the positions in key back to cell indices."""
+    cells = set()
+    for scope, sum1 in constraints:
+        cells.update(scope)
+    points = [(cell, coords(cell)) for cell in cells]
+
+    best = None
+    for a, b, c, d in TRANSFORMS:
+        moved = [(cell, a * row + b * col, c * row + d * col) for cell, (row, col) in points]
+        minRow = min(row for cell, row, col in moved)
+        minCol = min(col for cell, row, col in moved)
+        position = {cell: (row - minRow, col - minCol) for cell, row, col in moved}
+        key = tuple(sorted((tuple(sorted(position[cell] for cell in scope)), sum1)
+                           for scope, sum1 in constraints))
+        if best is None or key < best[0]:
+            best = (key, position)
+
+    key, position = best
+    return key, {pos: cell for cell, pos in position.items()}
+
+
+def componentBackbone(constraints):
+    """Solve one frontier component on its own. Return ({cell: value} for the cells that have
+    the same value in every solution, number of solutions), or None if there is no solution."""
+    counted = msProbability.countComponent(constraints)
+    if counted is None:
+        return None
+    cells, total, mineCounts = counted
+    solutions = sum(total)
+    forced = {}
+    for cell, counts in zip(cells, mineCounts):
+        mines = sum(counts)
+        if mines == 0:
+            forced[cell] = 0
+        elif mines == solutions:
+            forced[cell] = 1
+    return forced, solutions
+
+
+def sizeOf(obj):
+    """Rough memory use of nested tuples of ints, in bytes."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, tuple):
+        for item in obj:
+            size += sizeOf(item)
+    return size
+
+
+class ComponentCache:
+    """Bounded LRU cache of solved frontier components.
+
+    Components are stored in canonical form, so the same shape anywhere on the board and in
+    any orientation is solved once. A value is the backbone of the component (the cells
+    forced in every solution) and its number of solutions, if the solver counted them. maxBytes bounds the estimated
+    size of keys and values, components with more than maxCells cells are solved but not
+    stored as they rarely come back."""
+
+    def __init__(self, maxBytes=16 * 1024 * 1024, maxCells=40):
+        self.maxBytes = maxBytes
+        self.maxCells = maxCells
+        # key -> (((position, value), ...), solutions, size)
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "hit_rate": self.hitRate()}
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def solve(self, constraints, coords, solver=componentBackbone):
+        """Backbone of a component, served from the cache when the same shape was solved before.
+        Misses are solved by solver(constraints), which returns ({cell: value}, solutions) as
+        componentBackbone does, with solutions None when it does not count them.
+        Return ({cell: value}, solutions) or None."""
+        cells = set()
+        for scope, sum1 in constraints:
+            cells.update(scope)
+        if len(cells) > self.maxCells:
+            return solver(constraints)
+
+        key, cellAt = canonicalForm(constraints, coords)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            if instrument.enabled:
+                instrument.count("cacheHits")
+            self.entries.move_to_end(key)
+            forced, solutions, size = entry
+            return {cellAt[pos]: value for pos, value in forced}, solutions
+
+        self.misses += 1
+        if instrument.enabled:
+            instrument.count("cacheMisses")
+        solved = solver(constraints)
+        if solved is None:
+            return None
+        forced, solutions = solved
+
+        position = {cell: pos for pos, cell in cellAt.items()}
+        stored = tuple(sorted((position[cell], value) for cell, value in forced.items()))
+        size = sizeOf(key) + sizeOf(stored)
+        if size <= self.maxBytes:
+            self.entries[key] = (stored, solutions, size)
+            self.bytes += size
+            while self.bytes > self.maxBytes:
+                oldKey, (oldForced, oldSolutions, oldSize) = self.entries.popitem(last=False)
+                self.bytes -= oldSize
+                self.evictions += 1
+        return forced, solutions
@@ -0,0 +1,177 @@
+"""Board corpus files.
+
+A corpus is a header followed by fixed size records, one per board:
+
+    header  magic b"MSC1", row_size u16, col_size u16, mines u32, seed u64, count u32, flags u32
+    record  the mine map, one bit per cell (cell i is bit i % 8 of byte i // 8), then when
+            flags has HAS_FIRST_CLICK the flat index of the first click as u32 (NO_CELL if none)
+
+All numbers are little endian. Records have a fixed size, so board k is read straight from its
+offset and the reader never loads more of the file than it is asked for."""
+import argparse
+import mmap
+import random
+import struct
+
+import msEngine
+
+MAGIC = b"MSC1"
+HEADER = struct.Struct("<4sHHIQII")
+CELL = struct.Struct("<I")
+HAS_FIRST_CLICK = 1
+NO_CELL = 0xFFFFFFFF
+
+
+class CorpusBoard:
+    """One board of a corpus, MinesweeperEngine.import_board accepts it directly."""
+
+    def __init__(self, row_size, col_size, mines, first_cell=None):
+        self.row_size = row_size
+        self.col_size = col_size
+        # sorted flat indices of the mines
+        self.mines = mines
+        self.first_cell = first_cell
+
+    def values(self):
+        return msEngine.count_values(self.row_size, self.col_size, self.mines)
+
+
+def packMines(mines, size):
+    bits = 0
+    for mine in mines:
+        bits |= 1 << mine
+    return bits.to_bytes((size + 7) // 8, "little")
+
+
+def unpackMines(data):
+    mines = []
+    bits = int.from_bytes(data, "little")
+    while bits:
+        low = bits & -bits
+        mines.append(low.bit_length() - 1)
+        bits ^= low
+    return mines
+
+
+class CorpusWriter:
+    """Write boards of one size to a new corpus file, the count in the header is written on close.
+
+        with CorpusWriter(path, 16, 30, 99, seed=1, first_click=True) as writer:
+            writer.write(mines, first_cell)"""
+
+    def __init__(self, path, row_size, col_size, mines_amount, seed=0, first_click=False):
+        self.row_size = row_size
+        self.col_size = col_size
+        self.mines_amount = mines_amount
+        self.seed = seed
+        self.flags = HAS_FIRST_CLICK if first_click else 0
+        self.count = 0
+        self.file = open(path, "wb")
+        self.writeHeader()
+
+    def writeHeader(self):
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.row_size, self.col_size, self.mines_amount, self.seed,
+                                    self.count, self.flags))
+
+    def write(self, mines, first_cell=None):
+        """Append a board given by its mine indices."""
+        if len(mines) != self.mines_amount:
+            raise ValueError("expected {0} mines, got {1}".format(self.mines_amount, len(mines)))
+        self.file.write(packMines(mines, self.row_size * self.col_size))
+        if self.flags & HAS_FIRST_CLICK:
+            self.file.write(CELL.pack(NO_CELL if first_cell is None else first_cell))
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.writeHeader()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CorpusReader:
+    """Memory mapped corpus file. len(reader), reader[k] and iteration give CorpusBoard objects,
+    only the pages of the boards read are loaded."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.row_size, self.col_size, self.mines_amount, self.seed, self.count, self.flags = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{0} is not a board corpus".format(path))
+
+        self.mapBytes = (self.row_size * self.col_size + 7) // 8
+        self.recordBytes = self.mapBytes + (CELL.size if self.flags & HAS_FIRST_CLICK else 0)
+        if HEADER.size + self.count * self.recordBytes > len(self.map):
+            self.close()
+            raise ValueError("{0} is truncated".format(path))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += self.count
+        if not 0 <= k < self.count:
+            raise IndexError("board {0} out of range".format(k))
+        offset = HEADER.size + k * self.recordBytes
+        mines = unpackMines(self.map[offset:offset + self.mapBytes])
+        first_cell = None
+        if self.flags & HAS_FIRST_CLICK:
+            first_cell = CELL.unpack_from(self.map, offset + self.mapBytes)[0]
+            if first_cell == NO_CELL:
+                first_cell = None
+        return CorpusBoard(self.row_size, self.col_size, mines, first_cell)
+
+    def __iter__(self):
+        for k in range(self.count):
+            yield self[k]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def writeCorpus(path, count, row_size, col_size, mines_amount, seed=0, first_cell=None):
+    """Write count seeded boards to path, the same boards msEngine.generate_boards gives for seed.
+    With first_cell the boards keep it and its neighbours free and it is stored as the first click."""
+    rng = random.Random(seed)
+    with CorpusWriter(path, row_size, col_size, mines_amount, seed, first_click=first_cell is not None) as writer:
+        for _ in range(count):
+            writer.write(msEngine.sample_mines(row_size, col_size, mines_amount, rng, first_cell), first_cell)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a seeded board corpus.")
+    parser.add_argument("path")
+    parser.add_argument("count", type=int)
+    parser.add_argument("--size", type=int, nargs=2, default=[16, 30], metavar=("ROWS", "COLS"))
+    parser.add_argument("--mines", type=int, default=99)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--first-click", type=int, nargs=2, default=None, metavar=("ROW", "COL"),
+                        help="keep this cell and its neighbours free and store it as the first click")
+    args = parser.parse_args()
+
+    first_cell = None
+    if args.first_click:
+        first_cell = args.first_click[0] * args.size[1] + args.first_click[1]
+    writeCorpus(args.path, args.count, args.size[0], args.size[1], args.mines, args.seed, first_cell)
+
+
+if __name__ == "__main__":
+    main()
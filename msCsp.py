@@ -1,77 +1,55 @@
-import itertools
+from collections import deque
+
+import instrument
 from csp import *
 
 
-def cspModel(minesweeper):
-    """Initialize a csp model."""
+def cspModel(game):
+    """Initialize a csp model over the unknown cells next to a number.
+    Variables are named by integer ids, index[id] is the flat cell index of a variable
+    or -1 for an overlap variable. Return (csp, index).
+    The number of mines left is not in the model, msProbability.mineCounts handles it exactly."""
+    timed = instrument.enabled
+    if timed:
+        t = instrument.start()
     csp = CSP("Minesweeper")
-
-    # list of lists, same structure as board in minesweeper
-    variables = []
-
-    # Initialize all variables in board.
-    for row in range(minesweeper.row_size):
-        temp_row = []
-        for col in range(minesweeper.col_size):
-            name = str(row) + " " + str(col)
-            if minesweeper.board[row][col].is_flag():
-                domain = [1]
-            elif minesweeper.board[row][col].is_show():
-                domain = [0]
-            else:
-                domain = [0, 1]
-            var = Variable(name, domain)
-            temp_row.append(var)
-            csp.addVariable(var)
-        variables.append(temp_row)
+    index = []
 
     # Initialize all constraints.
-    # cons = [[name(str), [variable, variable,..], sum(int)], ...]
+    # cons = [[name(str), [cell, cell,..], sum(int)], ...]
     cons = []
-    unassign = []
-    for button in minesweeper.buttons:
-        # Assign value to all known variables.
-        if button.is_show():
-            variables[button.x][button.y].assign(0)
-        elif button.is_flag():
-            variables[button.x][button.y].assign(1)
-        else:
-            unassign.append(variables[button.x][button.y])
-
-        # Constraint info for a non-empty visible button.
-        if button.is_show() and not button.value == 0:
-            surrounding = minesweeper.get_surrounding_buttons(button.x, button.y)
+    for i in range(game.row_size * game.col_size):
+        # Constraint info for a non-empty visible cell.
+        if game.visible[i] and not game.values[i] == 0:
             scope = []
-            sum1 = button.value
-            for sur in surrounding:
-                if sur.is_flag():
+            sum1 = game.values[i]
+            for sur in game.get_surrounding(i):
+                if game.flagged[sur]:
                     sum1 -= 1
-                if not sur.is_show() and not sur.is_flag():
-                    scope.append(variables[sur.x][sur.y])
-            name = str(button.x) + " " + str(button.y)
+                if not game.visible[sur] and not game.flagged[sur]:
+                    scope.append(sur)
+            name = cellName(game, i)
 
-            # Avoid empty scope. (All surrounding buttons are either visible or flagged.)
+            # Avoid empty scope. (All surrounding cells are either visible or flagged.)
             if scope:
                 cons.append([name, scope, sum1])
 
-    # end-game: give it a fixed # 20:
-    if len(unassign) <= 20:
-        cons.append(["endgame", unassign, minesweeper.remaining_mines])
-
-    # Sort cons by length of scope.
-    cons.sort(key=lambda x: len(x[1]))
+    # Initialize variables for the cells in a constraint's scope only.
+    variables = {}
+    for con in cons:
+        scope = []
+        for i in con[1]:
+            if i not in variables:
+                var = Variable(len(index), [0, 1])
+                index.append(i)
+                csp.addVariable(var)
+                variables[i] = var
+            scope.append(variables[i])
+        con[1] = scope
 
     # Reduce constraint's scope.
     # ex: c1=[v1,v2,v3], c2=[v1,v2] => reduce c1 to [v3]
-    for i in range(len(cons) - 1):
-        con1 = cons[i]
-        for j in range(i + 1, len(cons)):
-            con2 = cons[j]
-            if set(con1[1]) == set(con2[1]):
-                continue
-            if set(con1[1]) & set(con2[1]) == set(con1[1]):
-                con2[1] = list(set(con2[1]).difference(set(con1[1])))
-                con2[2] = con2[2] - con1[2]
+    reduceSubsets(cons)
 
     # Sort cons by length of scope.
     cons.sort(key=lambda x: len(x[1]))
@@ -79,63 +57,338 @@ def cspModel(minesweeper):
     # overlap cons, same structure as cons list: [[name(str), [variable, variable,..], sum(int)], ...]
     ol_cons = []
 
-    # list of lists, with [{var, var, var...},{}...]
-    ol_set = []
-    ol_var = []
+    # frozenset of overlap variables -> the Variable standing for them
+    ol_var = {}
+
+    # Scope sets built once, and variable -> indices of the constraints using it, so only
+    # constraints that share a variable are ever paired.
+    scopes = [frozenset(con[1]) for con in cons]
+    var_cons = {}
+    for i, scope in enumerate(scopes):
+        for var in scope:
+            var_cons.setdefault(var, []).append(i)
 
     # Add new constraints if two constraints has at least two same variables in scope.
     # Create a new variable for overlap variables.
     # ex: c1=[v1,v2,v3], c2=[v2,v3,v4] => add c3=[v1,v2v3], c4=[v2v3,v4]. v2v3 is a new variable.
     for i in range(len(cons) - 1):
-        con1 = cons[i]
-        for j in range(i + 1, len(cons)):
-            con2 = cons[j]
-            if set(con1[1]) == set(con2[1]):
+        partners = set()
+        for var in scopes[i]:
+            partners.update(var_cons[var])
+        for j in sorted(partners):
+            if j <= i or scopes[i] == scopes[j]:
                 continue
-            if 1 < len(set(con1[1]) & set(con2[1])):
-                ol_vars = set(con1[1]) & set(con2[1])
-                con1_vars = set(con1[1]) - ol_vars
-                con2_vars = set(con2[1]) - ol_vars
-                con1_sum = con1[2]
-                con2_sum = con2[2]
-                name = ""
-
-                if ol_vars not in ol_set:
-                    for k in ol_vars:
-                        name += k.name + ", "
-                    name = "(" + name + ")"
-                    var = Variable(name, list(range(len(ol_vars) + 1)))
+            ol_vars = scopes[i] & scopes[j]
+            if 1 < len(ol_vars):
+                var = ol_var.get(ol_vars)
+                if var is None:
+                    var = Variable(len(index), list(range(len(ol_vars) + 1)))
+                    index.append(-1)
                     csp.addVariable(var)
-                    ol_var.append(var)
-                    ol_set.append(ol_vars)
-                else:
-                    index = ol_set.index(ol_vars)
-                    var = ol_var[index]
+                    ol_var[ol_vars] = var
 
-                con1_vars.add(var)
-                con2_vars.add(var)
-                ol_cons.append(["", list(con1_vars), con1_sum])
-                ol_cons.append(["", list(con2_vars), con2_sum])
+                ol_cons.append(["", [v for v in cons[i][1] if v not in ol_vars] + [var], cons[i][2]])
+                ol_cons.append(["", [v for v in cons[j][1] if v not in ol_vars] + [var], cons[j][2]])
 
     cons.extend(ol_cons)
 
-    # Create Constraint object for constraint in cons list.
+    # Create SumConstraint object for constraint in cons list.
     for con in cons:
-        constraint = Constraint(con[0], con[1])
-        tuples = satisfyTuples(con[1], con[2])
-        constraint.addSatisfyingTuples(tuples)
-        csp.addConstraint(constraint)
-
-    return csp
-
-
-def satisfyTuples(scope, sum1):
-    product_list = []
-    for var in scope:
-        product_list.append(var.domain())
-    product = list(itertools.product(*product_list))
-    tuples = []
-    for tuple in product:
-        if sum(tuple) == sum1:
-            tuples.append(tuple)
-    return tuples
+        csp.addConstraint(SumConstraint(con[0], con[1], con[2]))
+
+    if timed:
+        instrument.stop("cspModel", t)
+        instrument.count("constraints", len(csp.cons))
+        instrument.count("variables", len(csp.vars))
+    return csp, index
+
+
+def reduceSubsets(cons):
+    """Subtract every constraint from the constraints whose scope strictly contains it, until
+    no such pair is left. cons = [[name, [variable, ..], sum], ...] is changed in place.
+    Supersets are looked up through a variable -> constraints index, and a reduced constraint
+    goes back on the worklist since it may now be contained in others."""
+    timed = instrument.enabled
+    if timed:
+        t = instrument.start()
+    scopes = [set(con[1]) for con in cons]
+    var_cons = {}
+    for i, scope in enumerate(scopes):
+        for var in scope:
+            var_cons.setdefault(var, set()).add(i)
+
+    # Smallest first, so a constraint is mostly reduced before it is used to reduce others.
+    queue = deque(sorted(range(len(cons)), key=lambda i: len(scopes[i])))
+    inQueue = set(queue)
+    reductions = 0
+    while queue:
+        i = queue.popleft()
+        inQueue.discard(i)
+        scope = scopes[i]
+        if not scope:
+            continue
+        # Every superset uses all variables of scope, so the rarest one bounds the candidates.
+        rarest = min(scope, key=lambda var: len(var_cons[var]))
+        for j in list(var_cons[rarest]):
+            if j == i or not scope < scopes[j]:
+                continue
+            scopes[j] -= scope
+            for var in scope:
+                var_cons[var].discard(j)
+            cons[j][2] -= cons[i][2]
+            reductions += 1
+            if j not in inQueue:
+                inQueue.add(j)
+                queue.append(j)
+
+    for con, scope in zip(cons, scopes):
+        if len(scope) != len(con[1]):
+            con[1] = [var for var in con[1] if var in scope]
+    if timed:
+        instrument.stop("reduceSubsets", t)
+        instrument.count("reductions", reductions)
+    return cons
+
+
+def componentModel(constraints):
+    """CSP over the cells of one frontier component, constraints are (frozenset of cell indices,
+    sum) pairs. Every cell is a variable, named by its position in index, and every constraint a
+    SumConstraint over them. Return (csp, index)."""
+    csp = CSP("Component")
+    index = sorted(set().union(*(scope for scope, sum1 in constraints)))
+    variables = {}
+    for i in index:
+        variables[i] = Variable(len(variables), [0, 1])
+        csp.addVariable(variables[i])
+    for scope, sum1 in constraints:
+        csp.addConstraint(SumConstraint("", [variables[i] for i in sorted(scope)], sum1))
+    return csp, index
+
+
+def cellName(game, i):
+    row, col = divmod(i, game.col_size)
+    return str(row) + " " + str(col)
+
+
+class IncrementalModel:
+    """CSP model of a game that is kept up to date instead of rebuilt on every solve step.
+    The engine reports every cell that changes, update() then only re-derives the constraints
+    around those cells together with the subset reductions and overlap variables built from them.
+    Subset reductions are only taken over pairs of constraints. Chains over more of them, as
+    reduceSubsets finds for cspModel, are rare on real boards and can spread over a whole dense
+    frontier, and the backbone search finds the same cells without them.
+
+    Only unknown cells in a constraint's scope and overlap variables are in the model. Variables
+    are named by integer ids, index[id] is the flat cell index of a variable, -1 for an overlap
+    variable, and vars[id] is the Variable or None for an id that is free for reuse."""
+
+    def __init__(self, game):
+        self.game = game
+        game.add_listener(self.cellChanged)
+        self.reset()
+
+    def reset(self):
+        self.csp = CSP("Minesweeper")
+        # Start from the cells already open or flagged, the model may be made mid game.
+        game = self.game
+        self.dirty = set(i for i in range(game.row_size * game.col_size) if game.visible[i] or game.flagged[i])
+
+        # base constraints: key (cell index) -> (frozenset of cell indices, sum)
+        self.base = {}
+        # cell index -> keys of the base constraints with the cell in scope
+        self.cellToBase = {}
+        # pair of base keys -> list of derived Constraint objects
+        self.derived = {}
+        # base key -> pairs it takes part in
+        self.pairsOf = {}
+        # base key -> its Constraint object
+        self.baseCons = {}
+
+        self.index = []
+        self.vars = []
+        # vid -> number of constraints using the variable
+        self.refs = []
+        self.freeIds = []
+
+        # cell index -> vid or -1, frozenset of cells -> vid of its overlap variable, and back
+        self.cellIds = [-1] * (self.game.row_size * self.game.col_size)
+        self.olIds = {}
+        self.olCells = {}
+
+        # vids of the cell variables, and the variables in the scope of a constraint added or
+        # removed since the last takeChanged, in a dict so they come back in the order they changed.
+        self.cellVids = set()
+        self.changed = {}
+
+    def takeChanged(self):
+        """Return the variables still in the model whose constraints changed since the last call.
+        The components of the model without one of them are the same as at the last call."""
+        changed = [var for var in self.changed if self.vars[var.name] is var]
+        self.changed = {}
+        return changed
+
+    def cellChanged(self, index):
+        if index is None:
+            self.reset()
+        else:
+            self.dirty.add(index)
+
+    def update(self):
+        """Bring the model up to date with the cells that changed since the last call."""
+        if not self.dirty:
+            return self.csp
+        timed = instrument.enabled
+        if timed:
+            t = instrument.start()
+            instrument.count("dirtyCells", len(self.dirty))
+        game = self.game
+
+        affected = set()
+        for i in self.dirty:
+            affected.add(i)
+            affected.update(game.get_surrounding(i))
+        self.dirty = set()
+
+        for i in affected:
+            con = None
+            if game.visible[i] and game.values[i] > 0:
+                scope = []
+                sum1 = game.values[i]
+                for sur in game.get_surrounding(i):
+                    if game.flagged[sur]:
+                        sum1 -= 1
+                    elif not game.visible[sur]:
+                        scope.append(sur)
+                if scope:
+                    con = (frozenset(scope), sum1)
+            self.setBase(i, con)
+
+        if timed:
+            instrument.stop("modelUpdate", t)
+        return self.csp
+
+    def constraints(self):
+        """Return the (cells, sum) constraint of every visible number next to unknown cells."""
+        return list(self.base.values())
+
+    def setBase(self, key, con):
+        """Replace the base constraint stored under key, con is (cells, sum) or None to drop it."""
+        if self.base.get(key) == con:
+            return
+        if key in self.base:
+            self.removeBase(key)
+        if con is not None:
+            self.addBase(key, con)
+
+    def addBase(self, key, con):
+        cells, sum1 = con
+        self.base[key] = con
+        self.pairsOf[key] = set()
+        self.baseCons[key] = self.addConstraint(cellName(self.game, key), [self.cellVar(i) for i in cells], sum1)
+
+        others = set()
+        for i in cells:
+            bases = self.cellToBase.setdefault(i, set())
+            others.update(bases)
+            bases.add(key)
+
+        for other in others:
+            derived = self.deriveConstraints(con, self.base[other])
+            if derived:
+                pair = (key, other)
+                self.derived[pair] = derived
+                self.pairsOf[key].add(pair)
+                self.pairsOf[other].add(pair)
+
+    def removeBase(self, key):
+        cells, sum1 = self.base.pop(key)
+        for i in cells:
+            self.cellToBase[i].discard(key)
+            if not self.cellToBase[i]:
+                del self.cellToBase[i]
+
+        for pair in self.pairsOf.pop(key):
+            other = pair[1] if pair[0] == key else pair[0]
+            self.pairsOf[other].discard(pair)
+            for c in self.derived.pop(pair):
+                self.removeConstraint(c)
+
+        self.removeConstraint(self.baseCons.pop(key))
+
+    def deriveConstraints(self, con1, con2):
+        """Subset reduction or overlap constraints of two base constraints sharing cells.
+        ex: c1=[v1,v2,v3], c2=[v1,v2] => add [v3]
+        ex: c1=[v1,v2,v3], c2=[v2,v3,v4] => add [v1,v2v3], [v2v3,v4]. v2v3 is a new variable."""
+        cells1, sum1 = con1
+        cells2, sum2 = con2
+        if cells1 == cells2:
+            return []
+        if cells1 < cells2:
+            return [self.addConstraint("", [self.cellVar(i) for i in cells2 - cells1], sum2 - sum1)]
+        if cells2 < cells1:
+            return [self.addConstraint("", [self.cellVar(i) for i in cells1 - cells2], sum1 - sum2)]
+
+        ol_cells = cells1 & cells2
+        if len(ol_cells) < 2:
+            return []
+        derived = []
+        for cells, sum1 in ((cells1, sum1), (cells2, sum2)):
+            scope = [self.cellVar(i) for i in cells - ol_cells]
+            scope.append(self.overlapVar(ol_cells))
+            derived.append(self.addConstraint("", scope, sum1))
+        return derived
+
+    def cellVar(self, i):
+        vid = self.cellIds[i]
+        if vid < 0:
+            vid = self.newVar(i, [0, 1])
+            self.cellIds[i] = vid
+            self.cellVids.add(vid)
+        return self.vars[vid]
+
+    def overlapVar(self, cells):
+        vid = self.olIds.get(cells)
+        if vid is None:
+            vid = self.newVar(-1, list(range(len(cells) + 1)))
+            self.olIds[cells] = vid
+            self.olCells[vid] = cells
+        return self.vars[vid]
+
+    def newVar(self, cell, domain):
+        if self.freeIds:
+            vid = self.freeIds.pop()
+        else:
+            vid = len(self.index)
+            self.index.append(-1)
+            self.vars.append(None)
+            self.refs.append(0)
+        var = Variable(vid, domain)
+        self.index[vid] = cell
+        self.vars[vid] = var
+        self.csp.addVariable(var)
+        return vid
+
+    def addConstraint(self, name, scope, sum1):
+        constraint = SumConstraint(name, scope, sum1)
+        self.csp.addConstraint(constraint)
+        for var in scope:
+            self.refs[var.name] += 1
+        self.changed.update(dict.fromkeys(scope))
+        return constraint
+
+    def removeConstraint(self, constraint):
+        self.csp.removeConstraint(constraint)
+        self.changed.update(dict.fromkeys(constraint.scope))
+        for var in constraint.scope:
+            vid = var.name
+            self.refs[vid] -= 1
+            if not self.refs[vid]:
+                self.csp.removeVariable(var)
+                if self.index[vid] >= 0:
+                    self.cellIds[self.index[vid]] = -1
+                    self.cellVids.discard(vid)
+                else:
+                    del self.olIds[self.olCells.pop(vid)]
+                self.index[vid] = -1
+                self.vars[vid] = None
+                self.freeIds.append(vid)
@@ -0,0 +1,339 @@
+import random
+from collections import deque
+
+SURROUNDING = ((-1, -1), (-1, 0), (-1, 1),
+               (0, -1), (0, 1),
+               (1, -1), (1, 0), (1, 1))
+
+# (row_size, col_size) -> neighbour table, see neighbour_table
+neighbour_tables = {}
+
+
+def neighbour_table(row_size, col_size):
+    """Tuple of the flat neighbour indices of every cell, built once per board size."""
+    key = (row_size, col_size)
+    table = neighbour_tables.get(key)
+    if table is None:
+        cells = []
+        for row in range(row_size):
+            for col in range(col_size):
+                cells.append(tuple((row + dr) * col_size + col + dc for dr, dc in SURROUNDING
+                                   if 0 <= row + dr < row_size and 0 <= col + dc < col_size))
+        table = neighbour_tables[key] = tuple(cells)
+    return table
+
+
+def generate_board(row_size, col_size, mines_amount, rng, first_cell=None):
+    """Random board as (values, mines): values[index] is the number of surrounding mines or -1
+    for a mine, mines the sorted mine indices, see sample_mines. rng is a random.Random."""
+    mines = sample_mines(row_size, col_size, mines_amount, rng, first_cell)
+    return count_values(row_size, col_size, mines), mines
+
+
+def sample_mines(row_size, col_size, mines_amount, rng, first_cell=None):
+    """Sorted random mine indices, drawn without replacement from the cells allowed. first_cell
+    and its neighbours are kept free when there is room for that and first_cell alone otherwise."""
+    size = row_size * col_size
+    if first_cell is None:
+        allowed = range(size)
+    else:
+        excluded = set(neighbour_table(row_size, col_size)[first_cell])
+        excluded.add(first_cell)
+        if size - len(excluded) < mines_amount:
+            excluded = {first_cell}
+        allowed = [i for i in range(size) if i not in excluded]
+    if mines_amount > len(allowed):
+        raise ValueError("{0} mines do not fit on a {1}x{2} board".format(mines_amount, row_size, col_size))
+    return sorted(rng.sample(allowed, mines_amount))
+
+
+def count_values(row_size, col_size, mines):
+    """Board values for the given mine indices, the number of surrounding mines or -1 for a mine."""
+    neighbours = neighbour_table(row_size, col_size)
+    values = [0] * (row_size * col_size)
+    for mine in mines:
+        for i in neighbours[mine]:
+            values[i] += 1
+    for mine in mines:
+        values[mine] = -1
+    return values
+
+
+def generate_boards(row_size, col_size, mines_amount, count, seed=0, first_cell=None):
+    """Yield count seeded boards as (values, mines), see generate_board."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield generate_board(row_size, col_size, mines_amount, rng, first_cell)
+
+
+class CellSet:
+    """Set of the cell indices of one board with O(1) add, remove and membership.
+    Members are kept in a list, so len() and indexing (random.choice) need no scan."""
+
+    def __init__(self, size, full=False):
+        self.cells = list(range(size)) if full else []
+        # position[index]: where index is in cells, -1 when not a member
+        self.position = list(range(size)) if full else [-1] * size
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __getitem__(self, k):
+        return self.cells[k]
+
+    def __contains__(self, index):
+        return self.position[index] >= 0
+
+    def copy(self):
+        other = CellSet(0)
+        other.cells = list(self.cells)
+        other.position = list(self.position)
+        return other
+
+    def add(self, index):
+        if self.position[index] < 0:
+            self.position[index] = len(self.cells)
+            self.cells.append(index)
+
+    def remove(self, index):
+        k = self.position[index]
+        if k >= 0:
+            last = self.cells.pop()
+            if last != index:
+                self.cells[k] = last
+                self.position[last] = k
+            self.position[index] = -1
+
+
+class MinesweeperEngine:
+    """Headless Minesweeper game.
+    The board is kept in flat arrays, cell (row, col) lives at index row * col_size + col."""
+
+    def __init__(self, row_size=10, col_size=10, mines_amount=10, seed=None):
+        self.row_size = row_size
+        self.col_size = col_size
+        self.mines_amount = mines_amount
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Optional move recorder (see msLog.MoveLog): recorder.move(kind, index, source) is called
+        # for every reveal and flag, recorder.layout(game) once the mines are in place.
+        self.recorder = None
+
+        # Called with the index of every cell that changes, or None when the whole board is reset.
+        self.listeners = []
+
+        self.new_game()
+
+    def new_game(self):
+        """Initialize all attributes for new game."""
+        size = self.row_size * self.col_size
+
+        # neighbours[index]: flat indices of the cells around index, shared by all games of a size.
+        self.neighbours = neighbour_table(self.row_size, self.col_size)
+
+        # values: number of surrounding mines, -1 for a mine.
+        self.values = [0] * size
+        self.visible = bytearray(size)
+        self.flagged = bytearray(size)
+        # scratch marks for reveal, all 0 between calls
+        self.marked = bytearray(size)
+        self.mines = []
+
+        # cells neither visible nor flagged, and the number of cells that are neither visible nor
+        # mines. The game is won when the latter reaches 0.
+        self.hidden_cells = CellSet(size, full=True)
+        self.hidden_safe = size
+
+        self.remaining_mines = self.mines_amount
+        self.flags = 0
+        self.is_over = False
+        self.hit_mine = None
+
+        self.first_click = True
+        self.first_click_cell = None
+
+        self.notify(None)
+
+    def import_board(self, board):
+        """Import game from a list of lists with numbers, -1 for a mine, or from a board read
+        with msCorpus (anything with row_size, col_size and mines)."""
+        if hasattr(board, "mines"):
+            self.row_size = board.row_size
+            self.col_size = board.col_size
+            self.mines_amount = len(board.mines)
+            self.new_game()
+            self.set_mines(count_values(self.row_size, self.col_size, board.mines), board.mines)
+        else:
+            self.row_size = len(board)
+            self.col_size = len(board[0])
+            self.mines_amount = sum(1 for row in board for value in row if value == -1)
+            self.new_game()
+
+            for row in range(self.row_size):
+                for col in range(self.col_size):
+                    i = row * self.col_size + col
+                    self.values[i] = board[row][col]
+                    if board[row][col] == -1:
+                        self.mines.append(i)
+            self.hidden_safe -= len(self.mines)
+
+        # Mines are already in place, the first click must not add more.
+        self.first_click = False
+        if self.recorder is not None:
+            self.recorder.layout(self)
+
+    def copy(self):
+        """Headless copy of the game as it is now, without listeners or recorder. Its random
+        generator is seeded from this one, so both stay reproducible."""
+        other = MinesweeperEngine.__new__(MinesweeperEngine)
+        other.__dict__.update(self.__dict__)
+        other.random = random.Random(self.random.getrandbits(64))
+        other.listeners = []
+        other.recorder = None
+        other.values = list(self.values)
+        other.visible = bytearray(self.visible)
+        other.flagged = bytearray(self.flagged)
+        other.marked = bytearray(self.marked)
+        other.mines = list(self.mines)
+        other.hidden_cells = self.hidden_cells.copy()
+        return other
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, index):
+        for listener in self.listeners:
+            listener(index)
+
+    def index(self, row, col):
+        return row * self.col_size + col
+
+    def coords(self, index):
+        """Return (row, col) of a flat cell index."""
+        return divmod(index, self.col_size)
+
+    def init_random_mines(self):
+        values, mines = generate_board(self.row_size, self.col_size, self.mines_amount, self.random,
+                                       self.first_click_cell)
+        self.set_mines(values, mines)
+
+    def set_mines(self, values, mines):
+        """Put a generated board in place, values and mines as from generate_board."""
+        self.values = values
+        self.mines = list(mines)
+        self.hidden_safe = sum(1 for i, value in enumerate(values) if value != -1 and not self.visible[i])
+
+    def get_surrounding(self, index):
+        """Return flat indices of the cells around index, a shared tuple that must not be changed."""
+        return self.neighbours[index]
+
+    def get_surrounding_cells(self, row, col):
+        """Return (row, col) of the cells around (row, col)."""
+        return [divmod(i, self.col_size) for i in self.neighbours[row * self.col_size + col]]
+
+    def is_show(self, index):
+        return self.visible[index] == 1
+
+    def is_flag(self, index):
+        return self.flagged[index] == 1
+
+    def is_mine(self, index):
+        return self.values[index] == -1
+
+    def show(self, index):
+        if not self.visible[index] and not self.flagged[index]:
+            self.visible[index] = 1
+            self.hidden_cells.remove(index)
+            if self.values[index] != -1:
+                self.hidden_safe -= 1
+            self.notify(index)
+
+    def reveal(self, row, col, source="user"):
+        """Left click on (row, col). source tells the recorder who made the move."""
+        if self.is_over:
+            return
+
+        index = row * self.col_size + col
+        if self.recorder is not None:
+            self.recorder.move("reveal", index, source)
+        if self.first_click:
+            self.first_click_cell = index
+            self.init_random_mines()
+            self.first_click = False
+            if self.recorder is not None:
+                self.recorder.layout(self)
+
+        if self.visible[index] or self.flagged[index]:
+            return
+
+        # Case0: hits a number cell
+        self.show(index)
+
+        # Case1: hits a mine
+        if self.values[index] == -1:
+            self.hit_mine = index
+            self.is_over = True
+            self.notify(index)
+            return
+
+        # Case2: hits an empty cell, open the region breadth first. An empty cell is queued once,
+        # when it is marked, so every cell of the region is looked at a bounded number of times.
+        elif self.values[index] == 0:
+            neighbours = self.neighbours
+            values = self.values
+            visible = self.visible
+            marked = self.marked
+            marked[index] = 1
+            queue = deque([index])
+            opened = [index]
+            while queue:
+                for neighbour in neighbours[queue.popleft()]:
+                    if not visible[neighbour]:
+                        if values[neighbour] == 0 and not marked[neighbour]:
+                            marked[neighbour] = 1
+                            opened.append(neighbour)
+                            queue.append(neighbour)
+                        self.show(neighbour)
+            for i in opened:
+                marked[i] = 0
+
+        if self.is_win():
+            self.is_over = True
+
+    def flag(self, row, col, source="user"):
+        """Right click on (row, col), toggles the flag. source tells the recorder who made the move."""
+        if self.is_over:
+            return
+
+        index = row * self.col_size + col
+        if self.recorder is not None:
+            self.recorder.move("flag", index, source)
+        if self.visible[index]:
+            return
+
+        if self.flagged[index]:
+            self.flagged[index] = 0
+            self.flags -= 1
+            self.hidden_cells.add(index)
+        else:
+            self.flagged[index] = 1
+            self.flags += 1
+            self.hidden_cells.remove(index)
+        self.notify(index)
+
+        self.remaining_mines = (self.mines_amount - self.flags) if self.flags < self.mines_amount else 0
+
+        if self.is_win():
+            self.is_over = True
+
+    def is_win(self):
+        """The game wins if all cells that are not mines are visible."""
+        return self.hit_mine is None and self.hidden_safe == 0
@@ -0,0 +1,198 @@
+"""Append-only binary move logs and their replay.
+
+A log starts with the magic b"MSL1" and is then a stream of records, each starting with a tag:
+
+    GAME    seed u64 (NO_SEED if none), row_size u16, col_size u16, mines u32
+    LAYOUT  row_size u16, col_size u16, then the mine map as in msCorpus
+    MOVE    kind u8 (REVEAL, FLAG), source u8 (index in SOURCES), cell u32
+    END     won u8
+
+All numbers are little endian. Games follow each other, every game is a GAME record, its moves
+in order with the LAYOUT once the mines are placed, and an END record. Replaying the moves on
+the logged layout gives back every board the game went through, no solver needed."""
+import argparse
+import struct
+
+import msCorpus
+import msCsp
+from msEngine import MinesweeperEngine
+
+MAGIC = b"MSL1"
+GAME, LAYOUT, MOVE, END = 1, 2, 3, 4
+REVEAL, FLAG = 0, 1
+KINDS = ["reveal", "flag"]
+
+# Who made a move, guesses are reveals with source "guess".
+SOURCES = ["user", "solver", "patterns", "cache", "prop_BT", "prop_FC", "prop_GAC", "guess", "global",
+           "prop_GAC_cheapest"]
+OTHER = 255
+NO_SEED = 0xFFFFFFFFFFFFFFFF
+
+GAME_RECORD = struct.Struct("<BQHHI")
+LAYOUT_RECORD = struct.Struct("<BHH")
+MOVE_RECORD = struct.Struct("<BBBI")
+END_RECORD = struct.Struct("<BB")
+
+
+class MoveLog:
+    """Writes the games of engines attached to it to an append-only log file.
+
+        log = MoveLog(path)
+        log.attach(game)
+        ...
+        log.end(game)"""
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def attach(self, game):
+        """Start a game record and log the moves of game from now on."""
+        seed = game.seed if game.seed is not None and 0 <= game.seed < NO_SEED else NO_SEED
+        self.file.write(GAME_RECORD.pack(GAME, seed, game.row_size, game.col_size, game.mines_amount))
+        game.recorder = self
+        if not game.first_click:
+            self.layout(game)
+
+    def layout(self, game):
+        self.file.write(LAYOUT_RECORD.pack(LAYOUT, game.row_size, game.col_size))
+        self.file.write(msCorpus.packMines(game.mines, game.row_size * game.col_size))
+
+    def move(self, kind, index, source):
+        code = SOURCES.index(source) if source in SOURCES else OTHER
+        self.file.write(MOVE_RECORD.pack(MOVE, KINDS.index(kind), code, index))
+
+    def end(self, game):
+        """Close the game record of game and detach from it."""
+        self.file.write(END_RECORD.pack(END, 1 if game.is_win() else 0))
+        self.file.flush()
+        game.recorder = None
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LoggedGame:
+    """One game read back from a log. moves are (kind, cell index, source) with kind and
+    source as strings, won is None when the log ends before the game does."""
+
+    def __init__(self, seed, row_size, col_size, mines_amount):
+        self.seed = seed
+        self.row_size = row_size
+        self.col_size = col_size
+        self.mines_amount = mines_amount
+        self.mines = None
+        self.moves = []
+        self.won = None
+
+
+def readLog(path):
+    """Yield the LoggedGame objects of a log in order."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("{0} is not a move log".format(path))
+
+    offset = len(MAGIC)
+    game = None
+    while offset < len(data):
+        tag = data[offset]
+        if tag == GAME:
+            if game is not None:
+                yield game
+            tag, seed, row_size, col_size, mines_amount = GAME_RECORD.unpack_from(data, offset)
+            offset += GAME_RECORD.size
+            game = LoggedGame(None if seed == NO_SEED else seed, row_size, col_size, mines_amount)
+        elif tag == LAYOUT:
+            tag, game.row_size, game.col_size = LAYOUT_RECORD.unpack_from(data, offset)
+            offset += LAYOUT_RECORD.size
+            size = (game.row_size * game.col_size + 7) // 8
+            game.mines = msCorpus.unpackMines(data[offset:offset + size])
+            offset += size
+        elif tag == MOVE:
+            tag, kind, source, cell = MOVE_RECORD.unpack_from(data, offset)
+            offset += MOVE_RECORD.size
+            game.moves.append((KINDS[kind], cell, SOURCES[source] if source < len(SOURCES) else "other"))
+        elif tag == END:
+            game.won = bool(data[offset + 1])
+            offset += END_RECORD.size
+            yield game
+            game = None
+        else:
+            raise ValueError("bad record tag {0} at byte {1} of {2}".format(tag, offset, path))
+    if game is not None:
+        yield game
+
+
+def replay(logged, steps=None):
+    """Play the moves of a LoggedGame on its layout, the first steps of them when steps is given.
+    Return the MinesweeperEngine."""
+    game = MinesweeperEngine(logged.row_size, logged.col_size, logged.mines_amount, seed=logged.seed)
+    if logged.mines is not None:
+        game.import_board(msCorpus.CorpusBoard(logged.row_size, logged.col_size, logged.mines))
+    for kind, cell, source in logged.moves[:steps]:
+        row, col = game.coords(cell)
+        if kind == "reveal":
+            game.reveal(row, col, source)
+        else:
+            game.flag(row, col, source)
+    return game
+
+
+def dumpModel(game):
+    """Text dump of the board and of the cspModel built from it."""
+    lines = []
+    for row in range(game.row_size):
+        line = []
+        for col in range(game.col_size):
+            i = game.index(row, col)
+            if game.flagged[i]:
+                line.append("F")
+            elif not game.visible[i]:
+                line.append(".")
+            elif game.values[i] == -1:
+                line.append("*")
+            else:
+                line.append(str(game.values[i]))
+        lines.append(" ".join(line))
+
+    csp, index = msCsp.cspModel(game)
+    lines.append("{0} variables, {1} constraints".format(len(csp.vars), len(csp.cons)))
+    for con in csp.cons:
+        names = []
+        for var in con.scope:
+            if index[var.name] >= 0:
+                names.append("({0})".format(msCsp.cellName(game, index[var.name])))
+            else:
+                names.append("v{0}[0..{1}]".format(var.name, var.getDomainSize() - 1))
+        lines.append("{0}: {1} = {2}".format(con.name or "overlap", " + ".join(names), con.total))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise or replay a move log.")
+    parser.add_argument("path")
+    parser.add_argument("--game", type=int, default=None, help="replay this game, counted from 0")
+    parser.add_argument("--step", type=int, default=None, help="stop after this many moves")
+    args = parser.parse_args()
+
+    for k, logged in enumerate(readLog(args.path)):
+        if args.game is None:
+            print("game {0}: seed {1} {2}x{3}/{4} moves {5} won {6}".format(
+                k, logged.seed, logged.row_size, logged.col_size, logged.mines_amount, len(logged.moves), logged.won))
+        elif k == args.game:
+            for n, (kind, cell, source) in enumerate(logged.moves[:args.step]):
+                print("{0} {1} {2} {3}".format(n, kind, divmod(cell, logged.col_size), source))
+            print(dumpModel(replay(logged, args.step)))
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import instrument
+
+# (row_size, col_size) -> pair table, see pairTable
+pairTables = {}
+
+
+def pairTable(game):
+    """For every cell A, the cells B within two rows and columns of it as (B, onlyA, onlyB):
+    onlyA are the neighbours of A that are not neighbours of B (B itself left out) and onlyB the
+    other way round. Built once per board size, the local patterns are read off it."""
+    key = (game.row_size, game.col_size)
+    table = pairTables.get(key)
+    if table is not None:
+        return table
+
+    size = game.row_size * game.col_size
+    neighbours = [set(game.get_surrounding(i)) for i in range(size)]
+    table = []
+    for a in range(size):
+        row, col = game.coords(a)
+        pairs = []
+        for r in range(max(0, row - 2), min(game.row_size, row + 3)):
+            for c in range(max(0, col - 2), min(game.col_size, col + 3)):
+                b = game.index(r, c)
+                if b != a:
+                    pairs.append((b, tuple(sorted(neighbours[a] - neighbours[b] - {b})),
+                                  tuple(sorted(neighbours[b] - neighbours[a] - {a}))))
+        table.append(pairs)
+    pairTables[key] = table
+    return table
+
+
+class PatternDeducer:
+    """Cheap local deductions, tried before the CSP.
+
+    The engine reports every cell that changes and only the numbers around those cells are
+    looked at again. Two rules are used, both only ever give moves that hold in every solution:
+    a number whose mines are all flagged or whose hidden neighbours must all be mines, and for
+    two numbers A and B close to each other, when A needs as many more mines than B as it has
+    hidden cells B does not see, those cells are mines and the ones only B sees are safe
+    (1-1, 1-2, 1-2-1 and 1-2-2-1 are all cases of it)."""
+
+    def __init__(self, game):
+        self.game = game
+        game.add_listener(self.cellChanged)
+        self.dirty = set(i for i in range(game.row_size * game.col_size) if game.visible[i])
+
+    def cellChanged(self, index):
+        if index is None:
+            self.dirty = set()
+        else:
+            self.dirty.add(index)
+
+    def cellInfo(self, i):
+        """Return (hidden neighbours, mines left among them) of a visible number."""
+        game = self.game
+        hidden = []
+        left = game.values[i]
+        for sur in game.get_surrounding(i):
+            if game.flagged[sur]:
+                left -= 1
+            elif not game.visible[sur]:
+                hidden.append(sur)
+        return hidden, left
+
+    def isNumber(self, i):
+        return self.game.visible[i] and self.game.values[i] > 0
+
+    def deduce(self):
+        """Work through the changed cells, return the forced (cell index, value) pairs found."""
+        if not self.dirty:
+            return []
+        timed = instrument.enabled
+        if timed:
+            t = instrument.start()
+        game = self.game
+        table = pairTable(game)
+
+        numbers = set()
+        for i in self.dirty:
+            if self.isNumber(i):
+                numbers.add(i)
+            for sur in game.get_surrounding(i):
+                if self.isNumber(sur):
+                    numbers.add(sur)
+        self.dirty = set()
+
+        moves = {}
+        info = {}
+        for a in sorted(numbers):
+            if a not in info:
+                info[a] = self.cellInfo(a)
+            hidden, left = info[a]
+            if not hidden:
+                continue
+
+            # Single cell saturation.
+            if left == 0 or left == len(hidden):
+                for cell in hidden:
+                    moves[cell] = 1 if left else 0
+                continue
+
+            # Pairs of numbers.
+            for b, onlyA, onlyB in table[a]:
+                if not self.isNumber(b):
+                    continue
+                if b not in info:
+                    info[b] = self.cellInfo(b)
+                if not info[b][0]:
+                    continue
+                left_b = info[b][1]
+                hiddenA = [cell for cell in onlyA if not game.visible[cell] and not game.flagged[cell]]
+                hiddenB = [cell for cell in onlyB if not game.visible[cell] and not game.flagged[cell]]
+                if left - left_b == len(hiddenA) and (hiddenA or hiddenB):
+                    for cell in hiddenA:
+                        moves[cell] = 1
+                    for cell in hiddenB:
+                        moves[cell] = 0
+                elif left_b - left == len(hiddenB) and (hiddenA or hiddenB):
+                    for cell in hiddenB:
+                        moves[cell] = 1
+                    for cell in hiddenA:
+                        moves[cell] = 0
+
+        if timed:
+            instrument.stop("patterns", t)
+            instrument.count("patternMoves", len(moves))
+        return sorted(moves.items())
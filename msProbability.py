@@ -0,0 +1,303 @@
+import argparse
+import itertools
+import random
+from math import comb
+
+from msEngine import MinesweeperEngine
+
+
+def frontierConstraints(game):
+    """Return (cells, sum) for every visible number with hidden neighbours, cells a frozenset of
+    flat indices of the hidden, unflagged neighbours and sum the mines left among them."""
+    constraints = []
+    for i in range(game.row_size * game.col_size):
+        if game.visible[i] and game.values[i] > 0:
+            cells = []
+            sum1 = game.values[i]
+            for sur in game.get_surrounding(i):
+                if game.flagged[sur]:
+                    sum1 -= 1
+                elif not game.visible[sur]:
+                    cells.append(sur)
+            if cells:
+                constraints.append((frozenset(cells), sum1))
+    return constraints
+
+
+def frontierComponents(constraints):
+    """Group constraints into connected components, two constraints are connected when they share a cell."""
+    parent = list(range(len(constraints)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    owner = {}
+    for k, (cells, sum1) in enumerate(constraints):
+        for cell in cells:
+            if cell in owner:
+                parent[find(k)] = find(owner[cell])
+            else:
+                owner[cell] = k
+
+    groups = {}
+    for k, con in enumerate(constraints):
+        groups.setdefault(find(k), []).append(con)
+    return list(groups.values())
+
+
+def addPoly(target, poly, shift=0):
+    """target += x^shift * poly, polynomials are lists of coefficients."""
+    if len(target) < len(poly) + shift:
+        target.extend([0] * (len(poly) + shift - len(target)))
+    for m, count in enumerate(poly):
+        target[m + shift] += count
+
+
+def mulPoly(a, b):
+    result = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                result[i + j] += x * y
+    return result
+
+
+def countComponent(constraints):
+    """Count the solutions of one connected component by number of mines.
+
+    Cells are taken in breadth first order and a state is the mines still needed by every
+    constraint that has been started but not finished, so the work follows the width of the
+    frontier instead of the number of solutions. A forward pass counts the ways to reach each
+    state, a backward pass the ways to finish from it.
+    Return (cells, total, mineCounts): total[m] is the number of solutions with m mines and
+    mineCounts[k][m] the number of those with cells[k] a mine, or None if there is no solution."""
+    cellCons = {}
+    for j, (cells, sum1) in enumerate(constraints):
+        for cell in cells:
+            cellCons.setdefault(cell, []).append(j)
+
+    # Breadth first order keeps few constraints open at a time.
+    start = min(cellCons)
+    cells = [start]
+    seen = {start}
+    for cell in cells:
+        for j in cellCons[cell]:
+            for other in sorted(constraints[j][0]):
+                if other not in seen:
+                    seen.add(other)
+                    cells.append(other)
+    n = len(cells)
+    pos = {cell: i for i, cell in enumerate(cells)}
+
+    positions = [sorted(pos[cell] for cell in con[0]) for con in constraints]
+    first = [p[0] for p in positions]
+    last = [p[-1] for p in positions]
+    openAt = [[j for j in range(len(constraints)) if first[j] < i <= last[j]] for i in range(n + 1)]
+
+    # Transition plans for cell i: every constraint open after it comes from the state before
+    # it or starts at its sum, constraints ending at cell i must be met exactly.
+    plans = []
+    for i in range(n):
+        src = {j: k for k, j in enumerate(openAt[i])}
+        hit = set(cellCons[cells[i]])
+        keep = []
+        for j in openAt[i + 1]:
+            cap = sum(1 for p in positions[j] if p > i)
+            keep.append((src.get(j, -1), constraints[j][1], j in hit, cap))
+        close = [(src.get(j, -1), constraints[j][1]) for j in hit if last[j] == i]
+        plans.append((keep, close))
+
+    # Forward pass, edges[i] holds (state, value, next state) for cell i.
+    forward = [dict() for _ in range(n + 1)]
+    forward[0][()] = [1]
+    edges = []
+    for i in range(n):
+        keep, close = plans[i]
+        cellEdges = []
+        for state, poly in forward[i].items():
+            for v in (0, 1):
+                new = []
+                for k, sum1, isHit, cap in keep:
+                    r = (state[k] if k >= 0 else sum1) - (v if isHit else 0)
+                    if r < 0 or r > cap:
+                        break
+                    new.append(r)
+                else:
+                    if all((state[k] if k >= 0 else sum1) == v for k, sum1 in close):
+                        new = tuple(new)
+                        addPoly(forward[i + 1].setdefault(new, []), poly, v)
+                        cellEdges.append((state, v, new))
+        edges.append(cellEdges)
+
+    total = forward[n].get(())
+    if total is None:
+        return None
+
+    # Backward pass.
+    backward = [dict() for _ in range(n + 1)]
+    backward[n][()] = [1]
+    for i in range(n - 1, -1, -1):
+        for state, v, new in edges[i]:
+            if new in backward[i + 1]:
+                addPoly(backward[i].setdefault(state, []), backward[i + 1][new], v)
+
+    mineCounts = []
+    for i in range(n):
+        counts = []
+        for state, v, new in edges[i]:
+            if v == 1 and new in backward[i + 1] and state in backward[i]:
+                addPoly(counts, mulPoly(forward[i][state], backward[i + 1][new]), 1)
+        mineCounts.append(counts)
+
+    return cells, total, mineCounts
+
+
+def mineCounts(game, constraints=None):
+    """Exact mine counts for every hidden, unflagged cell, taking the mines left into account.
+    Components are counted by number of mines and combined with the mines left and the
+    unconstrained cells through binomial weights. constraints are (cells, sum) pairs as from
+    frontierConstraints, computed from the board when None.
+    Return (counts, weight): weight is the number of layouts of the whole board that fit, and
+    counts {cell index: number of those layouts with a mine on the cell}. None when no layout fits."""
+    if constraints is None:
+        constraints = frontierConstraints(game)
+
+    components = []
+    frontier = set()
+    for group in frontierComponents(constraints):
+        counted = countComponent(group)
+        if counted is None:
+            return None
+        components.append(counted)
+        frontier.update(counted[0])
+
+    hidden = game.hidden_cells
+    interior = len(hidden) - len(frontier)
+    remaining = game.mines_amount - game.flags
+
+    # weights[M]: ways to place the other mines in the interior when the frontier holds M.
+    weights = [comb(interior, remaining - m) if 0 <= remaining - m <= interior else 0
+               for m in range(len(frontier) + 1)]
+
+    # Products of the other components' totals, from prefix and suffix products.
+    prefix = [[1]]
+    for cells, total, mineCounts in components:
+        prefix.append(mulPoly(prefix[-1], total))
+    suffix = [[1]]
+    for cells, total, mineCounts in reversed(components):
+        suffix.append(mulPoly(suffix[-1], total))
+    suffix.reverse()
+
+    allTotal = prefix[-1]
+    weight = sum(count * weights[m] for m, count in enumerate(allTotal))
+    if not weight:
+        return None
+
+    counts = {}
+    for k, (cells, total, mineCounts) in enumerate(components):
+        others = mulPoly(prefix[k], suffix[k + 1])
+
+        # effective[m]: weight of the rest of the board when this component holds m mines.
+        effective = [sum(count * weights[m + o] for o, count in enumerate(others) if m + o < len(weights))
+                     for m in range(len(total))]
+        for cell, cellCounts in zip(cells, mineCounts):
+            counts[cell] = sum(count * effective[m] for m, count in enumerate(cellCounts))
+
+    if interior:
+        # Layouts with a mine on one given interior cell: the other mines go to the other cells.
+        mines = sum(count * comb(interior - 1, remaining - m - 1)
+                    for m, count in enumerate(allTotal) if 0 <= remaining - m - 1 <= interior - 1)
+        for i in hidden:
+            if i not in frontier:
+                counts[i] = mines
+
+    return counts, weight
+
+
+def mineProbabilities(game, constraints=None):
+    """Exact probability of a mine for every hidden, unflagged cell, as {cell index: probability},
+    see mineCounts. Return None when no layout fits."""
+    counted = mineCounts(game, constraints)
+    if counted is None:
+        return None
+    counts, weight = counted
+    return {cell: count / weight for cell, count in counts.items()}
+
+
+def forcedCells(counts, weight):
+    """(cell index, value) for the cells with the same value in every layout, from mineCounts."""
+    forced = []
+    for cell, count in sorted(counts.items()):
+        if count == 0:
+            forced.append((cell, 0))
+        elif count == weight:
+            forced.append((cell, 1))
+    return forced
+
+
+def bruteForceCounts(game, constraints=None):
+    """mineCounts by trying every placement of the mines left on the hidden, unflagged cells.
+    Only for checking mineCounts on small boards."""
+    if constraints is None:
+        constraints = frontierConstraints(game)
+    hidden = list(game.hidden_cells)
+    remaining = game.mines_amount - game.flags
+    counts = {cell: 0 for cell in hidden}
+    weight = 0
+    if 0 <= remaining <= len(hidden):
+        for mines in itertools.combinations(hidden, remaining):
+            mines = set(mines)
+            if all(len(cells & mines) == sum1 for cells, sum1 in constraints):
+                weight += 1
+                for cell in mines:
+                    counts[cell] += 1
+    if not weight:
+        return None
+    return counts, weight
+
+
+def checkCounts(games, row_size=5, col_size=5, mines_amount=5, seed=0):
+    """Compare mineCounts with bruteForceCounts on every position of games random games, where
+    random safe cells are revealed and random mines flagged one at a time.
+    Return (positions checked, list of (game seed, move) where they differ)."""
+    rng = random.Random(seed)
+    positions = 0
+    mismatches = []
+    for _ in range(games):
+        game_seed = rng.getrandbits(32)
+        game = MinesweeperEngine(row_size, col_size, mines_amount, seed=game_seed)
+        move = 0
+        while not game.is_over:
+            cell = game.random.choice(game.hidden_cells)
+            if game.first_click or game.values[cell] != -1:
+                game.reveal(*game.coords(cell))
+            else:
+                game.flag(*game.coords(cell))
+            move += 1
+            positions += 1
+            if mineCounts(game) != bruteForceCounts(game):
+                mismatches.append((game_seed, move))
+    return positions, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check mineCounts against brute force enumeration.")
+    parser.add_argument("games", type=int, nargs="?", default=200)
+    parser.add_argument("--size", type=int, nargs=2, default=[5, 5], metavar=("ROWS", "COLS"))
+    parser.add_argument("--mines", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    positions, mismatches = checkCounts(args.games, args.size[0], args.size[1], args.mines, args.seed)
+    for game_seed, move in mismatches:
+        print("mismatch: game seed {0} after move {1}".format(game_seed, move))
+    print("{0} positions, {1} mismatches".format(positions, len(mismatches)))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import instrument
+import msCsp
+import msPatterns
+import msProbability
+from csp import *
+from props import *
+
+
+class Solver:
+    """CSP solver playing a headless MinesweeperEngine."""
+
+    def __init__(self, game, propagator=prop_BT, executor=None, cache=None, patterns=True, ordering=None):
+        self.game = game
+        self.model = msCsp.IncrementalModel(game)
+
+        # Local pattern tier run before the model is brought up to date, None to always use the CSP.
+        self.patterns = msPatterns.PatternDeducer(game) if patterns else None
+
+        # Options: prop_BT, prop_FC, prop_GAC
+        self.propagator = propagator
+
+        # Variable ordering for the search, a csp.VariableOrdering subclass, MRVOrdering when None.
+        self.ordering = ordering
+
+        # Optional concurrent.futures executor for large frontier components.
+        self.executor = executor
+
+        # Optional msCache.ComponentCache, frontier components are then looked up there and only
+        # the ones it has not seen are searched, one at a time, see cached_moves.
+        self.cache = cache
+
+        # Search counters summed over all solve steps.
+        self.nDecisions = 0
+        self.nPrunes = 0
+
+        # msProbability.mineCounts of the board as it is now, None when it changed since.
+        self.counted = None
+        game.add_listener(self.cellChanged)
+
+    def cellChanged(self, index):
+        self.counted = None
+
+    def solve_complete(self, cancel=None):
+        """Solve current game. cancel is an optional threading.Event, the game is left as it is
+        after the current step once it is set."""
+        game = self.game
+        if game.is_over:
+            return
+
+        for i in range(game.row_size * game.col_size):
+            if game.flagged[i]:
+                game.flag(*game.coords(i), source="solver")
+        while not game.is_over:
+            if cancel is not None and cancel.is_set():
+                return
+            assigned = self.solve_step()
+
+            if not assigned:
+                row, col = self.guess_move()
+                timed = instrument.enabled
+                if timed:
+                    t = instrument.start()
+                game.reveal(row, col, source="guess")
+                if timed:
+                    instrument.stop("moves", t)
+                    instrument.endStep(kind="guess", cell=[row, col], over=game.is_over)
+
+    def guess_move(self):
+        """Return (row, col) of a hidden cell to click when no safe move is known, the one
+        least likely to be a mine. Corners win ties as they open up the board more often."""
+        game = self.game
+        corners = [(0, 0), (0, game.col_size - 1), (game.row_size - 1, 0),
+                   (game.row_size - 1, game.col_size - 1)]
+
+        counted = self.mine_counts()
+        if counted is not None and counted[0]:
+            counts = counted[0]
+            corners = set(game.index(row, col) for row, col in corners)
+            best = min(counts, key=lambda i: (counts[i], i not in corners, i))
+            return game.coords(best)
+
+        # No layout fits the flags, fall back to corners and a random hidden cell.
+        for row, col in corners:
+            i = game.index(row, col)
+            if not game.visible[i] and not game.flagged[i]:
+                return row, col
+
+        return game.coords(game.random.choice(game.hidden_cells))
+
+    def solve_step(self):
+        game = self.game
+        is_assigned = False
+        timed = instrument.enabled
+        if timed:
+            stepTime = instrument.start()
+
+        # Cheapest tier first, the model and the search only run when the ones before found nothing.
+        source = "patterns"
+        moves = self.patterns.deduce() if self.patterns is not None else []
+        if not moves:
+            csp = self.model.update()
+            if self.cache is not None:
+                source = "cache"
+                moves = self.cached_moves()
+            else:
+                source = self.propagator.__name__
+                moves = self.csp_moves(csp)
+            if not moves:
+                source = "global"
+                counted = self.mine_counts()
+                if counted is not None:
+                    moves = msProbability.forcedCells(*counted)
+
+        if timed:
+            t = instrument.start()
+        for i, value in moves:
+            row, col = game.coords(i)
+            if value == 1:
+                if not game.flagged[i]:
+                    game.flag(row, col, source)
+                    is_assigned = True
+            elif value == 0:
+                if not game.visible[i]:
+                    game.reveal(row, col, source)
+                    is_assigned = True
+
+        if timed:
+            instrument.stop("moves", t)
+            instrument.stop("solveStep", stepTime)
+            instrument.endStep(kind="step", moves=len(moves), over=game.is_over)
+        return is_assigned
+
+    def mine_counts(self):
+        """msProbability.mineCounts of the current board, kept until a cell changes."""
+        if self.counted is None:
+            self.model.update()
+            timed = instrument.enabled
+            if timed:
+                t = instrument.start()
+            self.counted = msProbability.mineCounts(self.game, self.model.constraints())
+            if timed:
+                instrument.stop("probabilities", t)
+        return self.counted
+
+    def cached_moves(self):
+        """Forced (cell index, value) pairs of the frontier components, from the cache."""
+        moves = []
+        for group in msProbability.frontierComponents(self.model.constraints()):
+            solved = self.cache.solve(group, self.game.coords, self.search_component)
+            if solved is not None:
+                moves.extend(sorted(solved[0].items()))
+        return moves
+
+    def search_component(self, constraints):
+        """Backbone of one frontier component by the search, for the cache.
+        Return ({cell index: value}, None), with no cells when the component has no solution."""
+        csp, index = msCsp.componentModel(constraints)
+        backbone, nDecisions, nPrunes = findBackbone(csp, self.propagator, self.ordering)
+        self.nDecisions += nDecisions
+        self.nPrunes += nPrunes
+        return {index[k]: value for k, value in enumerate(backbone) if value is not None}, None
+
+    def csp_moves(self, csp):
+        """(cell index, value) pairs that are the same in every solution of the model."""
+        # Independent frontier clusters are done one at a time, and only those that changed since
+        # the last search: the moves of a step change every cluster with a backbone cell, so the
+        # others have none. Only cell variables are checked, overlap variables are never played.
+        backbone, nDecisions, nPrunes = backboneComponents(csp, self.propagator, self.executor,
+                                                           ordering=self.ordering, names=self.model.cellVids,
+                                                           variables=self.model.takeChanged())
+        self.nDecisions += nDecisions
+        self.nPrunes += nPrunes
+        moves = []
+        for var, value in backbone:
+            i = self.model.index[var.name]
+            if i >= 0:
+                moves.append((i, value))
+        return moves
@@ -1,7 +1,22 @@
+import heapq
+from collections import deque
+
+import instrument
+
+
+def wipeout(csp, con):
+    """Record that con failed, for weighted variable ordering."""
+    con.weight += 1
+    csp.lastWipeout = con
+
 
 def prop_BT(csp, newVar=None):  # BACKTRACKING PROPAGATOR
     if not newVar:
         return True, []
+    timed = instrument.enabled
+    if timed:
+        t = instrument.start()
+    status = True
     for c in csp.getConstraintsWithVariables(newVar):
         if c.getNumberOfUnassignedVars() == 0:
             vals = []
@@ -9,11 +24,18 @@ def prop_BT(csp, newVar=None):  # BACKTRACKING PROPAGATOR
             for var in vars:
                 vals.append(var.getAssignedValue())
             if not c.check(vals):
-                return False, []
-    return True, []
+                wipeout(csp, c)
+                status = False
+                break
+    if timed:
+        instrument.stop("prop_BT", t)
+    return status, []
 
 
 def prop_FC(csp, newVar=None):  # FORWARD CHECKING PROPAGATOR
+    timed = instrument.enabled
+    if timed:
+        t = instrument.start()
     pruned = []
     isDeadEnd = False
 
@@ -25,6 +47,7 @@ def prop_FC(csp, newVar=None):  # FORWARD CHECKING PROPAGATOR
                 result = FCCheck(con, scope[0])
                 pruned.extend(result[1])
                 if not result[0]:
+                    wipeout(csp, con)
                     isDeadEnd = True
                     break
 
@@ -35,8 +58,12 @@ def prop_FC(csp, newVar=None):  # FORWARD CHECKING PROPAGATOR
             result = FCCheck(con, con.getUnassignedVars()[0])
             pruned.extend(result[1])
             if not result[0]:
+                wipeout(csp, con)
                 isDeadEnd = True
                 break
+    if timed:
+        instrument.stop("prop_FC", t)
+        instrument.count("prunes", len(pruned))
     if isDeadEnd:
         return False, pruned
     return True, pruned
@@ -56,42 +83,59 @@ def FCCheck(C, x):  # FORWARD CHECKING ALGORITHM
     return True, pruned
 
 
-def prop_GAC(csp, newVar=None):  # GENERALIZED ARC CONSISTENCY PROPAGATOR
-    queue = []
-    pruned = []
-    cons = csp.getAllConstraints()
-
+def prop_GAC(csp, newVar=None, cheapestFirst=False):  # GENERALIZED ARC CONSISTENCY PROPAGATOR
     if not newVar:
-        queue = cons.copy()
+        cons = csp.getAllConstraints()
     else:
-        queue = csp.getConstraintsWithVariables(newVar).copy()
+        cons = csp.getConstraintsWithVariables(newVar)
+    if not instrument.enabled:
+        return GACEnforce(csp, cons, cheapestFirst)
 
-    count = 0
-    while count < len(queue):
+    t = instrument.start()
+    status, pruned = GACEnforce(csp, cons, cheapestFirst)
+    instrument.stop("prop_GAC", t)
+    instrument.count("prunes", len(pruned))
+    return status, pruned
 
-        con = queue[count]
-        scope = con.getScope()
 
-        for i in range(len(scope)):
-            var = scope[i]
-            curDomain = var.getCurDomain()
-            found = False
-            for val in curDomain:
-                if con.hasSupport(var, val):
-                    continue
-                else:
-                    found = True
-                    var.pruneValue(val)
-                    pruned.append((var, val))
-                    if not var.getCurDomainSize():
-                        queue = []
-                        return False, pruned
-
-            if found:
-                cons = csp.getConstraintsWithVariables(var)
-                for c in cons:
-                    if c not in queue[count:]:
+def prop_GAC_cheapest(csp, newVar=None):
+    """prop_GAC revising the constraints with the fewest variables first."""
+    return prop_GAC(csp, newVar, True)
+
+
+def GACEnforce(csp, cons, cheapestFirst=False):  # GAC WORKLIST
+    """Revise constraints until every value left has a support. cons seeds the worklist, after
+    that a constraint is only queued again when a variable in its scope lost a value. With
+    cheapestFirst the queue is ordered by constraint arity instead of FIFO."""
+    pruned = []
+    inQueue = set(cons)
+    if cheapestFirst:
+        queue = [(len(c.scope), n, c) for n, c in enumerate(cons)]
+        heapq.heapify(queue)
+    else:
+        queue = deque(cons)
+    count = len(queue)
+
+    while queue:
+        if cheapestFirst:
+            con = heapq.heappop(queue)[2]
+        else:
+            con = queue.popleft()
+        inQueue.discard(con)
+
+        status, changed = con.revise(pruned)
+        if not status:
+            wipeout(csp, con)
+            return False, pruned
+
+        for var in changed:
+            for c in csp.vars_to_cons[var]:
+                if c is not con and c not in inQueue:
+                    inQueue.add(c)
+                    if cheapestFirst:
+                        heapq.heappush(queue, (len(c.scope), count, c))
+                        count += 1
+                    else:
                         queue.append(c)
-        count += 1
 
     return True, pruned